@@ -0,0 +1,107 @@
+"""Load test: many concurrent suggestion requests against the sync and the async server.
+
+Every client is one keep-alive HTTP/1.1 connection (plain asyncio streams, no HTTP client
+package) firing GET /api/<kind>?search=<prefix> back to back. Prefixes are cut from loaded
+names like in bench_autocomplete.py; add `nocache` to give each request a unique prefix so
+every one reaches Redis instead of the hot-prefix cache.
+
+Usage:
+    python redis_store.py                                            # sync (Flask) on :5000
+    ASYNC_PORT=5002 ASYNC_LOAD_MASTER_DATA=0 python redis_store_async.py  # async (Quart) on :5002
+    python bench_async_serving.py http://127.0.0.1:5000 http://127.0.0.1:5002 [clients] [requests] [nocache]
+"""
+from bench_autocomplete import sample_names, build_prefixes, percentile
+from urllib.parse import urlsplit, quote
+import asyncio
+import random
+import sys
+import time
+
+KIND = "items"
+
+
+async def open_connection(host, port):
+    return await asyncio.open_connection(host, port)
+
+
+async def http_get(conn, host, path):
+    """One GET on a keep-alive connection -> (status, keep_alive)"""
+    reader, writer = conn
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode())
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Server closed the connection")
+    version, status = status_line.split()[:2]
+    length, keep_alive = 0, version == b"HTTP/1.1"
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "connection":
+            keep_alive = value == "keep-alive" or (keep_alive and value != "close")
+    await reader.readexactly(length)
+    return int(status), keep_alive
+
+
+async def client(base_url, paths, timings, errors):
+    url = urlsplit(base_url)
+    conn = None
+    while paths:
+        path = paths.pop()
+        started = time.perf_counter()
+        try:
+            if conn is None:
+                conn = await open_connection(url.hostname, url.port or 80)
+            status, keep_alive = await http_get(conn, url.netloc, path)
+            if status != 200:
+                errors.append(status)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            errors.append(type(e).__name__)
+            keep_alive = False
+        timings.append((time.perf_counter() - started) * 1000)
+        if not keep_alive and conn is not None:
+            conn[1].close()
+            conn = None
+    if conn is not None:
+        conn[1].close()
+
+
+async def run_load(base_url, prefixes, clients):
+    paths = [f"/api/{KIND}?search={quote(prefix)}" for prefix in prefixes]
+    timings, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(client(base_url, paths, timings, errors) for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    print(f"{base_url:<24} clients={clients:<5} {len(timings) / elapsed:8,.0f} req/s  "
+          f"p50={percentile(timings, 0.50):7.1f}ms  p99={percentile(timings, 0.99):7.1f}ms  "
+          f"errors={len(errors)}")
+
+
+if __name__ == "__main__":
+    urls = [arg for arg in sys.argv[1:] if arg.startswith("http")]
+    numbers = [int(arg) for arg in sys.argv[1:] if arg.isdigit()]
+    clients = numbers[0] if numbers else 500
+    total = numbers[1] if len(numbers) > 1 else 20000
+    unique = "nocache" in sys.argv[1:]
+
+    names = sample_names(KIND, 5000)
+    if not names:
+        print(f"No {KIND} loaded; run redis_store.py first.")
+        sys.exit(1)
+    prefixes = build_prefixes(names, total)
+    if unique:
+        # "<prefix> <n>" never repeats, so the hot-prefix cache cannot answer it
+        prefixes = [f"{prefix} {i}" for i, prefix in enumerate(prefixes)]
+    random.shuffle(prefixes)
+
+    print(f"---- {total} {KIND} requests, {clients} concurrent clients{' (cache bypassed)' if unique else ''} ----")
+    for base_url in urls or ["http://127.0.0.1:5000", "http://127.0.0.1:5002"]:
+        asyncio.run(run_load(base_url, list(prefixes), clients))
@@ -0,0 +1,68 @@
+"""p50/p99 latency of the two autocomplete modes: FT.SEARCH prefix query vs FT.SUGGET.
+
+Prefixes (1-6 characters) are cut from a random sample of the loaded names, so the
+corpus looks like what users actually type. Needs redis_store to have loaded data.
+
+Usage:
+    python bench_autocomplete.py [customers|items] [samples]
+"""
+from master_data import r, MASTER_DATA, current_generation, generation_prefix
+import random
+import sys
+import time
+
+
+def sample_names(kind, limit):
+    spec = MASTER_DATA[kind]
+    prefix = generation_prefix(spec, current_generation(kind))
+    names = []
+    for key in r.scan_iter(match=f"{prefix}*", count=1000):
+        name = r.hget(key, "name")
+        if name:
+            names.append(name)
+        if len(names) >= limit:
+            break
+    return names
+
+
+def build_prefixes(names, count):
+    prefixes = []
+    for _ in range(count):
+        name = random.choice(names)
+        prefixes.append(name[:random.randint(1, min(6, len(name)))])
+    return prefixes
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct))]
+
+
+def measure(label, prefixes, command):
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        r.execute_command(*command(prefix))
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{label:<14} p50={percentile(timings, 0.50):7.3f}ms  p99={percentile(timings, 0.99):7.3f}ms  "
+          f"max={timings[-1]:7.3f}ms")
+
+
+if __name__ == "__main__":
+    kind = sys.argv[1] if len(sys.argv) > 1 else "items"
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    spec = MASTER_DATA[kind]
+
+    names = sample_names(kind, 5000)
+    if not names:
+        print(f"No {kind} loaded; run redis_store.py first.")
+        sys.exit(1)
+    prefixes = build_prefixes(names, samples)
+
+    print(f"---- {samples} {kind} prefixes ----")
+    measure("FT.SEARCH", prefixes, lambda p: (
+        "FT.SEARCH", spec["index"], f"{p}*", "RETURN", "1", "name", "LIMIT", "0", "10"))
+    measure("FT.SUGGET", prefixes, lambda p: (
+        "FT.SUGGET", spec["suggest"], p, "MAX", "10"))
+    measure("FT.SUGGET fz", prefixes, lambda p: (
+        "FT.SUGGET", spec["suggest"], p, "FUZZY", "MAX", "10"))
@@ -0,0 +1,77 @@
+"""Dispatch overhead per chat turn: the old `if action == ...` chain vs the flow_engine table.
+
+Both routers get the same no-op step bodies (the sales-order steps in their original order,
+plus `extra` padding steps to show how each scales with flow size), so the numbers are the
+routing cost alone: the if chain compares strings until it reaches the action, the registry
+does one dict lookup plus the transition checks against ChatSession.step.
+
+Usage:
+    python bench_flow_dispatch.py [turns] [extra_steps]
+"""
+from flow_engine import FlowRegistry
+from session_model import ChatSession
+import sys
+import time
+
+SALES_ORDER_STEPS = ["start", "customer_name", "date", "itm_description", "quantity",
+                     "add_more_items", "preview", "delete_item", "confirm"]
+
+
+def build_registry(actions):
+    flows = FlowRegistry()
+    for action in actions:
+        reply = {"reply": "", "next_action": action}  # stay on the step, so every turn is valid
+
+        @flows.step("sales_order", action, next_actions=(action,), entry=action == "start")
+        def handler(data, session_data, reply=reply):
+            return reply
+    flows.validate()
+    return flows
+
+
+def build_if_chain(actions):
+    """An `if action == "...": return ...` chain like the old sales_order_flow, generated for `actions`"""
+    lines = ["def flow(action, data, session_data):"]
+    for action in actions:
+        lines.append(f"    if action == {action!r}:")
+        lines.append(f"        return {{'reply': '', 'next_action': {action!r}}}")
+    lines.append("    return {'reply': 'Invalid step', 'next_action': 'start'}")
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["flow"]
+
+
+def time_chain(flow, action, turns):
+    session_data = ChatSession(use_case="sales_order", step=action)
+    started = time.perf_counter()
+    for _ in range(turns):
+        flow(action, None, session_data)
+    return (time.perf_counter() - started) / turns * 1e9
+
+
+def time_registry(flows, action, turns):
+    session_data = ChatSession(use_case="sales_order", step=action)
+    dispatch = flows.dispatch
+    started = time.perf_counter()
+    for _ in range(turns):
+        dispatch("sales_order", action, None, session_data)
+    return (time.perf_counter() - started) / turns * 1e9
+
+
+if __name__ == "__main__":
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    extra = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    # Padding goes before confirm, the last and most frequent step of a finished order
+    actions = SALES_ORDER_STEPS[:-1] + [f"custom_{n}" for n in range(extra)] + SALES_ORDER_STEPS[-1:]
+
+    flows, chain = build_registry(actions), build_if_chain(actions)
+    print(f"---- {turns:,} turns per action, {len(actions)} steps in the flow ----")
+    print(f"{'action':<18} {'if chain':>10} {'registry':>10}")
+    totals = [0.0, 0.0]
+    for action in SALES_ORDER_STEPS:
+        chain_ns, registry_ns = time_chain(chain, action, turns), time_registry(flows, action, turns)
+        totals[0] += chain_ns
+        totals[1] += registry_ns
+        print(f"{action:<18} {chain_ns:8.0f}ns {registry_ns:8.0f}ns")
+    n = len(SALES_ORDER_STEPS)
+    print(f"{'mean':<18} {totals[0] / n:8.0f}ns {totals[1] / n:8.0f}ns")
@@ -0,0 +1,71 @@
+"""Per-lookup latency of the chat_v7 customer query, with and without the HANA pool.
+
+Usage:
+    python bench_hana_pool.py "<Customer Name>" [iterations]
+"""
+from hdbcli import dbapi
+from hana_pool import HanaConnectionPool, HANA_HOST, HANA_PORT, HANA_USER, HANA_PASS
+import statistics
+import sys
+import time
+
+QUERY = '''
+SELECT T0."CardCode"
+FROM "MJENGO_TEST_020725"."OCRD" T0
+WHERE T0."CardName" = ?
+'''
+
+
+def lookup_direct(customer_name):
+    conn = dbapi.connect(address=HANA_HOST, port=HANA_PORT, user=HANA_USER, password=HANA_PASS)
+    cursor = conn.cursor()
+    cursor.execute(QUERY, (customer_name,))
+    cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+
+def lookup_pooled(pool, customer_name):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(QUERY, (customer_name,))
+        cursor.fetchone()
+        cursor.close()
+
+
+def measure(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "mean": statistics.mean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[int(len(timings) * 0.95) - 1],
+        "max": timings[-1],
+    }
+
+
+def report(label, result):
+    print(f"{label:<10} mean={result['mean']:8.2f}ms  p50={result['p50']:8.2f}ms  "
+          f"p95={result['p95']:8.2f}ms  max={result['max']:8.2f}ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    customer_name = sys.argv[1]
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    pool = HanaConnectionPool(HANA_HOST, HANA_PORT, HANA_USER, HANA_PASS, size=1)
+    lookup_pooled(pool, customer_name)  # warm up: first checkout opens the connection
+
+    print(f"---- {iterations} lookups of {customer_name!r} ----")
+    report("direct", measure(lambda: lookup_direct(customer_name), iterations))
+    report("pooled", measure(lambda: lookup_pooled(pool, customer_name), iterations))
+    print("Pool stats:", pool.stats())
+    pool.close()
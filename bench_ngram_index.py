@@ -0,0 +1,51 @@
+"""Latency of typo-tolerant item search (TrigramIndex) on a catalogue-sized corpus.
+
+Queries are real names with one or two typos injected, including in the first letters,
+which is exactly where RediSearch prefix search gives up.
+
+Usage:
+    python bench_ngram_index.py [names]
+"""
+from bench_prefix_index import synthetic_names, percentile
+from ngram_index import TrigramIndex
+import random
+import sys
+import time
+
+
+def with_typos(text, rng, count):
+    chars = list(text)
+    for _ in range(count):
+        pos = rng.randrange(min(len(chars), 4) if rng.random() < 0.5 else len(chars))
+        op = rng.choice(("swap", "drop", "replace"))
+        if op == "swap" and pos + 1 < len(chars):
+            chars[pos], chars[pos + 1] = chars[pos + 1], chars[pos]
+        elif op == "drop" and len(chars) > 3:
+            del chars[pos]
+        else:
+            chars[pos] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    return "".join(chars)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    records = synthetic_names(count)
+
+    start = time.perf_counter()
+    index = TrigramIndex(records)
+    print(f"names={len(index):,}  build={time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(3)
+    timings, found = [], 0
+    for _ in range(1000):
+        code, name = rng.choice(records)
+        query = with_typos(name, rng, rng.randint(1, 2))
+        start = time.perf_counter()
+        hits = index.search(query, limit=10)
+        timings.append((time.perf_counter() - start) * 1000)
+        found += any(ref == code for _, _, ref in hits)
+    timings.sort()
+
+    print(f"search: p50={percentile(timings, 0.50):.2f}ms  p99={percentile(timings, 0.99):.2f}ms  "
+          f"max={timings[-1]:.2f}ms")
+    print(f"intended name in top 10: {found / 10:.1f}%")
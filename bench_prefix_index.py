@@ -0,0 +1,80 @@
+"""Memory and lookup latency of the in-memory PrefixIndex at catalogue scale.
+
+Builds the index over synthetic SAP-style names (or real ones from HANA with --hana)
+and reports tracemalloc'd memory, build time and p50/p99 lookup latency.
+
+Usage:
+    python bench_prefix_index.py [names] [--hana customers|items]
+"""
+from prefix_index import PrefixIndex
+import tracemalloc
+import random
+import sys
+import time
+
+WORDS = [
+    "cement", "portland", "steel", "bar", "rod", "pipe", "pvc", "gi", "sheet", "roof", "nail",
+    "bolt", "nut", "washer", "paint", "white", "black", "red", "blue", "primer", "tile", "floor",
+    "wall", "sand", "ballast", "timber", "board", "ply", "glue", "wire", "mesh", "brc", "binding",
+    "galvanised", "hardware", "construction", "ltd", "limited", "enterprises", "traders", "co",
+]
+
+
+def synthetic_names(count):
+    rng = random.Random(42)
+    names = []
+    for i in range(count):
+        words = rng.sample(WORDS, rng.randint(2, 5))
+        size = f"{rng.choice([6, 8, 10, 12, 16, 20, 25, 50])}{rng.choice(['mm', 'kg', 'l', 'ft', ''])}"
+        names.append((f"C{i:07d}", " ".join(w.capitalize() for w in words) + f" {size}"))
+    return names
+
+
+def hana_names(kind):
+    from redis_store import MASTER_DATA, _stream_rows, _rows_query
+    names = []
+    for chunk in _stream_rows(*_rows_query(MASTER_DATA[kind])):
+        names.extend((row[0], row[1]) for row in chunk)
+    return names
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct))]
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if "--hana" in args:
+        records = hana_names(args[args.index("--hana") + 1])
+    else:
+        records = synthetic_names(int(args[0]) if args else 100_000)
+
+    start = time.perf_counter()
+    index = PrefixIndex(records)
+    build = time.perf_counter() - start
+
+    # Second build under tracemalloc (it slows allocation down, so it is not timed).
+    # Names are re-created while tracing so the figure includes the strings the index keeps.
+    tracemalloc.start()
+    measured = PrefixIndex((code.encode().decode(), name.encode().decode()) for code, name in records)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del measured
+
+    rng = random.Random(7)
+    prefixes = []
+    for _ in range(5000):
+        word = rng.choice(rng.choice(records)[1].split())
+        prefixes.append(word[:rng.randint(1, len(word))])
+
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        index.search(prefix, limit=10)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+
+    print(f"names={len(index):,}  entries={len(index._nids):,}")
+    print(f"memory: {current / 2**20:.1f} MiB held, {peak / 2**20:.1f} MiB peak while building")
+    print(f"build:  {build:.2f}s")
+    print(f"lookup: p50={percentile(timings, 0.50):.1f}us  p99={percentile(timings, 0.99):.1f}us  max={timings[-1]:.1f}us")
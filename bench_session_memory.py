@@ -0,0 +1,91 @@
+"""Bytes per chat session: the old nested dicts vs the __slots__ dataclasses of session_model.
+
+Builds N concurrent sales-order drafts (customer, date, `lines` order lines, one item
+waiting for its quantity) in both shapes from the same string objects, so tracemalloc
+counts only what the representation itself costs. Also compares the serialized size
+(session_store.dump_session) and the to/from-wire round trip time.
+
+Usage:
+    python bench_session_memory.py [sessions] [lines]
+"""
+from session_model import ChatSession, SalesOrderDraft, OrderLine
+from session_store import dump_session, load_session
+import tracemalloc
+import sys
+import time
+
+
+def session_values(i, lines):
+    """The strings/numbers of one draft, created up front and shared by both shapes"""
+    return {
+        "customer": (f"Customer {i:05d} Ltd", f"C{i:05d}", "2026-01-05"),
+        "lines": [(f"I{i % 977:05d}{n}", f"Portland Cement 50kg grade {n}", f"{12.5 + n:.2f}", str(n + 1))
+                  for n in range(lines)],
+        "current": (f"I{i % 501:05d}", "River Sand 1t", "30.00"),
+    }
+
+
+def dict_session(values):
+    """Shape chat_v7 used before session_model"""
+    name, code, date = values["customer"]
+    item_code, item_name, price = values["current"]
+    return {
+        "use_case": "sales_order",
+        "sales_order": {
+            "items": [{"ItemCode": c, "ItemName": n, "PriceUnit": p, "Quantity": q} for c, n, p, q in values["lines"]],
+            "customer_name": name,
+            "customer_code": code,
+            "document_date": date,
+            "current_item": {"ItemCode": item_code, "ItemName": item_name, "PriceUnit": price},
+        },
+        "invoice": {},
+        "other": {},
+    }
+
+
+def typed_session(values):
+    name, code, date = values["customer"]
+    item_code, item_name, price = values["current"]
+    return ChatSession(
+        use_case="sales_order",
+        sales_order=SalesOrderDraft(
+            customer_name=name, customer_code=code, document_date=date,
+            items=[OrderLine(c, n, p, q) for c, n, p, q in values["lines"]],
+            current_item=OrderLine(item_code, item_name, price),
+        ),
+    )
+
+
+def traced_bytes(build, all_values):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = [build(values) for values in all_values]
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return sessions, held
+
+
+def time_round_trip(sessions, to_wire, from_wire):
+    started = time.perf_counter()
+    for session in sessions:
+        from_wire(load_session(dump_session(to_wire(session))))
+    return (time.perf_counter() - started) / len(sessions) * 1e6
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    all_values = [session_values(i, lines) for i in range(count)]
+
+    dicts, dict_bytes = traced_bytes(dict_session, all_values)
+    typed, typed_bytes = traced_bytes(typed_session, all_values)
+    dict_wire = sum(len(dump_session(s)) for s in dicts) / count
+    typed_wire = sum(len(dump_session(s.to_wire())) for s in typed) / count
+    dict_us = time_round_trip(dicts, lambda s: s, lambda w: w)
+    typed_us = time_round_trip(typed, ChatSession.to_wire, ChatSession.from_wire)
+
+    print(f"---- {count:,} sales-order drafts, {lines} lines + 1 pending item each (strings excluded) ----")
+    print(f"{'shape':<12} {'bytes/session':>14} {'total MiB':>10} {'wire bytes':>11} {'round trip':>11}")
+    print(f"{'dicts':<12} {dict_bytes / count:14,.0f} {dict_bytes / 2**20:10.1f} {dict_wire:11,.0f} {dict_us:9.1f}us")
+    print(f"{'dataclasses':<12} {typed_bytes / count:14,.0f} {typed_bytes / 2**20:10.1f} {typed_wire:11,.0f} {typed_us:9.1f}us")
+    print(f"saved: {1 - typed_bytes / dict_bytes:.0%} in memory, {1 - typed_wire / dict_wire:.0%} on the wire")
@@ -0,0 +1,83 @@
+"""Concurrency check: N parallel lookups of the same customer/item hit the backend once.
+
+The Redis/HANA lookups in chat_v7 are replaced by slow fakes that count their calls, and
+the master-data version by a constant, so this runs without a database.
+
+Usage:
+    python bench_singleflight.py [parallel_callers]
+"""
+import chat_v7
+import threading
+import sys
+import time
+
+BACKEND_DELAY = 0.2  # seconds; long enough for every caller to arrive while the query is in flight
+
+
+def run_parallel(n, fn, arg):
+    barrier = threading.Barrier(n)
+    results = [None] * n
+    errors = [None] * n
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = fn(arg)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def check(label, n, resolver, patch_name, fake_result, arg):
+    calls = []
+
+    def fake_query(value):
+        calls.append(value)
+        time.sleep(BACKEND_DELAY)
+        return fake_result
+
+    original = getattr(chat_v7, patch_name)
+    setattr(chat_v7, patch_name, fake_query)
+    try:
+        results, _ = run_parallel(n, resolver, arg)
+    finally:
+        setattr(chat_v7, patch_name, original)
+
+    ok = len(calls) == 1 and all(res == fake_result for res in results)
+    print(f"{label:<10} callers={n:<4} backend_queries={len(calls):<3} {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def check_errors(n):
+    calls = []
+
+    def failing_query(value):
+        calls.append(value)
+        time.sleep(BACKEND_DELAY)
+        raise RuntimeError("HANA unavailable")
+
+    _, errors = run_parallel(n, lambda key: chat_v7.customer_flight.do(key, failing_query, key), "ERR-CUSTOMER")
+    ok = len(calls) == 1 and all(isinstance(e, RuntimeError) for e in errors)
+    print(f"{'errors':<10} callers={n:<4} backend_queries={len(calls):<3} {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    chat_v7.invalidate_lookup_caches()
+    chat_v7.names_version = lambda kind: "1.0"
+
+    results = [
+        check("customer", n, chat_v7.get_customer_code_from_db, "redis_customer_code",
+              "C0001", "Big Customer Ltd"),
+        check("item", n, chat_v7.get_item_details_from_db, "redis_item_details",
+              {"ItemCode": "I0001", "ItemName": "Cement 50kg", "PriceUnit": 1}, "Cement 50kg"),
+        check_errors(n),
+    ]
+    sys.exit(0 if all(results) else 1)
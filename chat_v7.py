@@ -1,37 +1,68 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from hdbcli import dbapi  # SAP HANA client
 from dotenv import load_dotenv
+from hana_pool import hana_connection
+from lookup_cache import TTLCache, SingleFlight
+from name_index import NameIndex, normalize_name
+from ngram_index import TrigramIndex
+from master_data import resolve_customer, resolve_item, record_order, names_version
+from session_store import make_session_store, SessionLocked
+from session_model import ChatSession, OrderLine
+from flow_engine import FlowRegistry
 from datetime import datetime
 from uuid import uuid4
+import threading
+import redis
+import time
 import os
 
 load_dotenv()
 
-db_address = os.getenv("DB_ADDRESS")
-db_port = os.getenv("DB_PORT")
-db_user = os.getenv("DB_USER")
-db_password = os.getenv("DB_PASSWORD")
-
 
 app = Flask(__name__)
 CORS(app)
 
-# Temporary storage for user input (for demonstration, resets on server restart)
-user_data = {}  # key = session_id, value = {use_case, sales_order, invoice, ...}
+# Session storage: SESSION_BACKEND=memory (this process only) or redis (shared by every worker)
+session_store = make_session_store()  # key = session_id, value = ChatSession.to_wire()
+SESSION_SAVE_RETRIES = 3  # re-runs of a step whose session was saved concurrently by another request
+
+# Master-data lookup caches (customer name -> CardCode, item description -> item details)
+customer_cache = TTLCache(
+    maxsize=int(os.getenv("CUSTOMER_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("CUSTOMER_CACHE_TTL", "600"))
+)
+item_cache = TTLCache(
+    maxsize=int(os.getenv("ITEM_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("ITEM_CACHE_TTL", "600"))
+)
+
+# Short-lived memory of names HANA did not know, so retried misspellings skip the round trip.
+# Each miss remembers the master-data version it was seen at: once the sync in redis_store
+# reloads or changes names (new generation/revision), the miss no longer counts.
+customer_misses = TTLCache(
+    maxsize=int(os.getenv("NEGATIVE_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("NEGATIVE_CACHE_TTL", "60"))
+)
+item_misses = TTLCache(
+    maxsize=int(os.getenv("NEGATIVE_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("NEGATIVE_CACHE_TTL", "60"))
+)
+
+REDIS_RETRY_AFTER = float(os.getenv("REDIS_RETRY_AFTER", "5"))  # seconds to skip Redis after it failed
+redis_down_until = 0.0  # monotonic time until which lookups skip the Redis resolver
+
+# Coalesce identical in-flight lookups, keyed like the caches above (see cached_lookup): Redis
+# answers by normalized name ("Big Customer Ltd" = "big customer ltd"), HANA by the name as typed
+customer_flight = SingleFlight()
+item_flight = SingleFlight()
 
 
 
 # --- HANA Database connection function ---
-def get_customer_code_from_db(customer_name):
-    try:
-        # Connect to HANA (replace with your credentials)
-        conn = dbapi.connect(
-            address=db_address,  # HANA server hostname or IP
-            port=db_port,           # HANA port (default: 30015 for SQL)
-            user=db_user,
-            password=db_password
-        )
+def query_customer_code(customer_name):
+    """Raw OCRD lookup; raises on HANA errors so coalesced waiters see them too"""
+    # Borrow a pooled connection (see hana_pool.py) instead of reconnecting per lookup
+    with hana_connection() as conn:
         cursor = conn.cursor()
 
         # Example query (adjust table & column names for your system)
@@ -46,27 +77,95 @@ def get_customer_code_from_db(customer_name):
         result = cursor.fetchone()
         print("Result : ", result)
         cursor.close()
-        conn.close()
 
-        if result:
-            return result[0]  # customer_code
-        else:
-            return None
+    if result:
+        return result[0]  # customer_code
+    else:
+        return None
+
+
+def redis_customer_code(customer_name):
+    """Redis resolver (matches on the normalized name); None if unknown, raises RedisError if Redis is down"""
+    customer = resolve_customer(customer_name)
+    return customer["code"] if customer else None
+
+
+def _names_version(kind):
+    """Master-data version a miss is valid for; "unknown" while Redis is down (then only the TTL expires misses).
+
+    After a Redis error, lookups go straight to HANA for REDIS_RETRY_AFTER seconds instead of
+    waiting for another connect timeout on every turn.
+    """
+    global redis_down_until
+    if time.monotonic() < redis_down_until:
+        return "unknown"
+    try:
+        return names_version(kind) or "0"
+    except redis.RedisError as e:
+        print(f"⚠️ Redis unavailable ({e}); resolving with HANA for {REDIS_RETRY_AFTER:.0f}s")
+        redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+        return "unknown"
+
+
+def _redis_step(kind, redis_lookup, name):
+    """Flight leader: (result or None, names version); the version is read first, so a sync
+    finishing meanwhile makes a remembered miss stale rather than current"""
+    version = _names_version(kind)
+    if version == "unknown":
+        return None, version  # Redis is down; the resolver would only fail again
+    try:
+        return redis_lookup(name), version
+    except redis.RedisError as e:
+        print(f"Redis resolver error ({kind}):", e)
+        return None, version
+
+
+def cached_lookup(kind, name, cache, misses, flight, redis_lookup, hana_lookup):
+    """Cached, coalesced master-data lookup: the Redis resolver first, HANA only as the fallback.
+
+    Redis matches on normalize_name, so its answers are cached and coalesced under the
+    normalized name and shared by every spelling. HANA matches its own way (exact CardName,
+    case-insensitive ItemName), so what it finds or misses is keyed on the name as typed.
+    """
+    name_key, exact_key = ("name", normalize_name(name)), ("exact", name)
+    for key in (name_key, exact_key):
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    # A remembered miss only counts while the names have not changed (one MGET, only when there is one)
+    seen = misses.get(exact_key)
+    if seen is not None and seen == _names_version(kind):
+        return None
+
+    found, version = flight.do(name_key, _redis_step, kind, redis_lookup, name)
+    if found:
+        cache.set(name_key, found)
+        return found
+
+    try:
+        # Concurrent requests for the same name share one HANA query
+        found = flight.do(exact_key, hana_lookup, name)
     except Exception as e:
-        print("HANA DB Error:", e)
+        print(f"HANA DB Error ({kind}):", e)
         return None
 
+    if found:
+        cache.set(exact_key, found)
+    else:
+        misses.set(exact_key, version)
+    return found
+
+
+def get_customer_code_from_db(customer_name):
+    return cached_lookup("customers", customer_name, customer_cache, customer_misses, customer_flight,
+                         redis_customer_code, query_customer_code)
+
 
 
 # --- HANA Database connection function for item ---
-def get_item_details_from_db(item_name):
-    try:
-        conn = dbapi.connect(
-            address=db_address,
-            port=db_port,
-            user=db_user,
-            password=db_password
-        )
+def query_item_details(item_name):
+    """Raw OITM lookup; raises on HANA errors so coalesced waiters see them too"""
+    with hana_connection() as conn:
         cursor = conn.cursor()
 
         query = '''
@@ -77,374 +176,570 @@ def get_item_details_from_db(item_name):
         cursor.execute(query, (item_name,))
         result = cursor.fetchone()
         cursor.close()
-        conn.close()
-
-        if result:
-            return {
-                "ItemCode": result[0],
-                "ItemName": result[1],
-                "PriceUnit": result[2]
-            }
-        else:
-            return None
-    except Exception as e:
-        print("HANA DB Error (Item):", e)
+
+    if result:
+        return {
+            "ItemCode": result[0],
+            "ItemName": result[1],
+            "PriceUnit": result[2]
+        }
+    else:
         return None
 
 
+def redis_item_details(item_name):
+    """Redis resolver for items; None if unknown, raises RedisError if Redis is down"""
+    return resolve_item(item_name)
 
 
+def get_item_details_from_db(item_name):
+    # In-process item index first; Redis/HANA only on a miss
+    item_details = lookup_item_in_index(item_name)
+    if item_details:
+        return item_details
+    return cached_lookup("items", item_name, item_cache, item_misses, item_flight,
+                         redis_item_details, query_item_details)
 
-def sales_order_flow(action, data, session_data):
-    flow_data = session_data["sales_order"]
 
-    if "items" not in flow_data:
-        flow_data["items"] = []
+def invalidate_negative_caches():
+    """Forget remembered misses; a reload may have added the names users were looking for"""
+    customer_misses.invalidate()
+    item_misses.invalidate()
 
-    # --- Start flow ---
-    if action == "start":
-        return jsonify(
-            reply="Great! Let's create a Sales Order. Please provide the Customer Name:",
-            next_action="customer_name"
-        )
 
-    # --- Customer name step ---
-    if action == "customer_name":
-        customer_name = data.get("customer_name")
-        if not customer_name:
-            return jsonify(reply="Please provide a valid Customer Name.", next_action="customer_name")
-
-        flow_data["customer_name"] = customer_name
-
-        customer_code = get_customer_code_from_db(customer_name)
-        if customer_code:
-            flow_data["customer_code"] = customer_code
-            msg = f"Customer recorded: {customer_name} (Code: {customer_code})."
-            return jsonify(
-                reply=f"{msg} Now, please provide Document Date (YYYY-MM-DD):",
-                next_action="date"
-            )
-        else:
-            # Customer not found → ask again
-            return jsonify(
-                reply=f"❌ Customer '{customer_name}' not found in database. Please try again with a valid Customer Name:",
-                next_action="customer_name"
-            )
+def invalidate_lookup_caches():
+    """Drop every cached customer/item lookup (e.g. after master data changed in SAP)"""
+    customer_cache.invalidate()
+    item_cache.invalidate()
+    invalidate_negative_caches()
 
-    # --- Date step ---
-    if action == "date":
-        document_date = data.get("document_date")
-        if not document_date:
-            return jsonify(reply="Please provide a valid document date (YYYY-MM-DD).", next_action="date")
-        
-        # Try to parse multiple date formats and convert to yyyy-mm-dd
-        parsed_date = None
-        possible_formats = [
-            "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%m-%d-%Y", "%m/%d/%Y",
-            "%Y-%b-%d", "%Y-%B-%d",  # 2020-Jan-16 / 2020-January-16
-            "%d-%b-%Y", "%d-%B-%Y",  # 30-Dec-2025 / 30-December-2025
-            "%d-%b-%y", "%d-%B-%y",  # 15-Jul-05 / 15-July-05
-            "%Y/%b/%d", "%d/%b/%Y", "%d/%B/%Y"
-        ]
-        for fmt in possible_formats:
-            try:
-                parsed_date = datetime.strptime(document_date, fmt)
-                break
-            except ValueError:
-                continue
-
-        if not parsed_date:
-            return jsonify(
-                reply="⚠️ Invalid date format. Please enter the date in YYYY-MM-DD format (e.g., 2025-10-29).",
-                next_action="date"
-            )
 
-        normalized_date = parsed_date.strftime("%Y-%m-%d")
-        flow_data["document_date"] = normalized_date
-        return jsonify(
-            reply=f"Date recorded as {normalized_date}. Please provide the first Item Description:",
-            next_action="itm_description"
-        )
 
+# --- In-process OITM name index ---
+ITEM_INDEX_REFRESH = float(os.getenv("ITEM_INDEX_REFRESH", "300"))  # seconds between incremental refreshes
 
-    # --- Item description step ---
-    if action == "itm_description":
-        itm_description = data.get("itm_description")
-        if not itm_description:
-            return jsonify(reply="Please provide a valid item description.", next_action="itm_description")
-
-        item_details = get_item_details_from_db(itm_description)
-        if item_details:
-            flow_data["current_item"] = {
-                "ItemCode": item_details["ItemCode"],
-                "ItemName": item_details["ItemName"],
-                "PriceUnit": item_details["PriceUnit"]
-            }
-            msg = f"Item recorded: {item_details['ItemName']} (Code: {item_details['ItemCode']}, Unit Price: {item_details['PriceUnit']})."
-            return jsonify(
-                reply=f"{msg} Now, please enter Item Quantity:",
-                next_action="quantity"
-            )
-        else:
-            # Item not found → ask again
-            return jsonify(
-                reply=f"❌ Item '{itm_description}' not found in database. Please enter a valid Item Description:",
-                next_action="itm_description"
-            )
+ITEM_SUGGESTIONS = int(os.getenv("ITEM_SUGGESTIONS", "3"))  # close names offered when an item is not found
+ITEM_FUZZY_MIN_SCORE = float(os.getenv("ITEM_FUZZY_MIN_SCORE", "0.5"))  # typo-tolerant suggestions must score this
 
+item_index = NameIndex(code_field="ItemCode", name_field="ItemName")
+item_fuzzy_index = TrigramIndex()  # rebuilt from item_index whenever it changes
+item_index_hwm = None  # latest OITM "UpdateDate" already applied to the index
 
-    # --- Quantity step ---
-    if action == "quantity":
-        quantity = data.get("quantity")
-        if not quantity:
-            return jsonify(reply="Please provide a valid quantity.", next_action="quantity")
 
-        if "current_item" not in flow_data:
-            return jsonify(reply="No current item found. Please add item description first.", next_action="itm_description")
+def _item_record(row):
+    return {"ItemCode": row[0], "ItemName": row[1], "PriceUnit": row[2]}
 
-        flow_data["current_item"]["Quantity"] = quantity
-        flow_data["items"].append(flow_data["current_item"])
-        del flow_data["current_item"]
 
-        count = len(flow_data["items"])
-        return jsonify(
-            reply=f"Item #{count} added successfully! Do you want to add another item? (yes/no)",
-            next_action="add_more_items"
-        )
+def refresh_item_index(full=False):
+    """Full build on first call, afterwards only rows changed since the last refresh"""
+    global item_index_hwm, item_fuzzy_index
 
-    # --- Add more items decision ---
-    if action == "add_more_items":
-        user_response = data.get("add_more_items", "").strip().lower()
-        if user_response in ["yes", "y"]:
-            return jsonify(
-                reply="Okay, please provide the next Item Description:",
-                next_action="itm_description"
-            )
-        elif user_response in ["no", "n"]:
-            return jsonify(
-                reply="Alright! Preparing Sales Order summary... Type 'VIEW' to show details",
-                next_action="preview"
-            )
+    with hana_connection() as conn:
+        cursor = conn.cursor()
+
+        if full or item_index_hwm is None:
+            cursor.execute('''
+            SELECT T0."ItemCode", T0."ItemName", T0."PriceUnit", T0."UpdateDate"
+            FROM "MJENGO_TEST_020725"."OITM" T0
+            ''')
+            rows = cursor.fetchall()
+            item_index.build(_item_record(row) for row in rows)
+            changed, removed = len(rows), 0
         else:
-            return jsonify(reply="Please reply with 'yes' or 'no'.", next_action="add_more_items")
-        
-
-    # --- Preview step ---
-    if action == "preview":
-        customer_name = flow_data.get("customer_name", "")
-        customer_code = flow_data.get("customer_code", "")
-        document_date = flow_data.get("document_date", "")
-        items = flow_data.get("items", [])
-
-        # Prepare fallback text
-        summary_lines = [
-            f"Customer: {customer_name} (Code: {customer_code})",
-            f"Document Date: {document_date}",
-            "Items:"
-        ]
-        for idx, item in enumerate(items, start=1):
-            summary_lines.append(
-                f"  {idx}. {item['ItemName']} (Code: {item['ItemCode']}, Qty: {item['Quantity']}, UnitPrice: {item['PriceUnit']})"
-            )
-        summary_text = "✅ Sales Order Preview:\n" + "\n".join(summary_lines)
-
-        # Prepare clean HTML table layout
-        html_items = ""
-        for i, item in enumerate(items, start=1):
-            html_items += f"""
-                <tr class='border-b border-gray-200'>
-                    <td class='px-4 py-2 text-center text-gray-800 font-medium'>{i}</td>
-                    <td class='px-4 py-2 text-gray-700'>{item['ItemName']}</td>
-                    <td class='px-4 py-2 text-center text-gray-700'>{item['ItemCode']}</td>
-                    <td class='px-4 py-2 text-center text-gray-700'>{item['Quantity']}</td>
-                    <td class='px-4 py-2 text-center text-gray-700'>{item['PriceUnit']}</td>
-                    <td class='px-4 py-2 text-center'>
-                        <button 
-                            class='bg-red-500 hover:bg-red-600 text-white px-3 py-1 rounded text-sm'
-                            onclick="deleteItem({i})">
-                            Delete
-                        </button>
-                    </td>
-                </tr>
-            """
-
-
-
-        reply_html = f"""
-        <div id='preview-container' style="font-family:sans-serif;">
-        <div class='bg-white border border-gray-300 rounded-xl shadow-md p-4 w-full max-w-2xl'>
-            <h3 class='text-lg font-bold text-primary mb-3'>✅ Sales Order Preview</h3>
-            <div class='text-gray-700 mb-2'><span class='font-semibold'>Customer:</span> {customer_name} ({customer_code})</div>
-            <div class='text-gray-700 mb-4'><span class='font-semibold'>Document Date:</span> {document_date}</div>
-
-            <div class='overflow-x-auto'>
-                <table class='min-w-full border border-gray-200 text-sm'>
-                    <thead class='bg-gray-100 text-gray-800 font-semibold'>
-                        <tr>
-                            <th class='px-4 py-2 text-left'>#</th>
-                            <th class='px-4 py-2 text-left'>Item Name</th>
-                            <th class='px-4 py-2 text-left'>Code</th>
-                            <th class='px-4 py-2 text-left'>Qty</th>
-                            <th class='px-4 py-2 text-left'>Unit Price</th>
-                            <th class='px-4 py-2 text-left'>Action</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {html_items}
-                    </tbody>
-                </table>
-            </div><br>
-            <div class='text-gray-700 mb-2'><span>Please type <b>Confirm</b> for SAP posting</span></div>
-        </div>
-        </div>
-        """
+            # ">=" because UpdateDate has day granularity; re-applying a row is harmless
+            cursor.execute('''
+            SELECT T0."ItemCode", T0."ItemName", T0."PriceUnit", T0."UpdateDate"
+            FROM "MJENGO_TEST_020725"."OITM" T0
+            WHERE T0."UpdateDate" >= ?
+            ''', (item_index_hwm,))
+            rows = cursor.fetchall()
+            changed = item_index.upsert(_item_record(row) for row in rows)
+
+            cursor.execute('SELECT "ItemCode" FROM "MJENGO_TEST_020725"."OITM"')
+            removed = item_index.retain(row[0] for row in cursor.fetchall())
 
-        return jsonify({
-            "reply": summary_text,   # Fallback
-            "reply_html": reply_html, # Rich formatted version
-            "next_action": "confirm", # <-- move to final confirm next
-            "summary_data": flow_data
-        })
-    
+        cursor.close()
 
-    # --- Delete item step ---
-    if action == "delete_item":
-        delete_index = data.get("delete_index")
-        if delete_index is None:
-            return jsonify(reply="Please specify which item number to delete.", next_action="preview")
+    update_dates = [row[3] for row in rows if row[3] is not None]
+    if update_dates:
+        item_index_hwm = max(update_dates + ([item_index_hwm] if item_index_hwm else []))
 
-        try:
-            delete_index = int(delete_index)
-            items = flow_data.get("items", [])
+    if changed or removed:
+        item_fuzzy_index = TrigramIndex((rec, rec["ItemName"]) for rec in item_index.records())
+        item_cache.invalidate()
+        item_misses.invalidate()
 
-            # 🛑 Prevent deleting if only one item left
-            if len(items) <= 1:
-                return jsonify(
-                    reply="⚠️ You must have at least one item in the Sales Order. Cannot delete the last remaining item.",
-                    next_action="preview"
-                )
+    print(f"✅ Item index: {len(item_index)} items ({changed} upserted, {removed} removed)")
 
-            if delete_index < 1 or delete_index > len(items):
-                return jsonify(reply=f"⚠️ Invalid item number: {delete_index}.", next_action="preview")
 
-            removed_item = items.pop(delete_index - 1)
-            reply_msg = f"🗑️ Deleted item #{delete_index}: {removed_item['ItemName']}."
+def lookup_item_in_index(item_name):
+    """Exact normalized match only, like the HANA lookup; near matches are suggested, never recorded"""
+    return item_index.exact(item_name)
 
-            # Return updated preview after deletion
-            return sales_order_flow("preview", data, session_data)
 
-        except Exception as e:
-            print("Delete item error:", e)
-            return jsonify(reply="⚠️ Something went wrong deleting the item.", next_action="preview")
+def suggest_item_names(item_name):
+    """Names the user may have meant: items starting with it, else the closest trigram matches"""
+    matches = item_index.prefix(item_name, limit=ITEM_SUGGESTIONS)
+    if not matches:
+        ranked = item_fuzzy_index.search(item_name, limit=ITEM_SUGGESTIONS, min_score=ITEM_FUZZY_MIN_SCORE)
+        matches = [rec for _, _, rec in ranked]
+    return [rec["ItemName"] for rec in matches]
 
 
+def start_item_index_refresher():
+    """Build the item index now and keep it fresh in a background thread"""
+    def run():
+        while True:
+            try:
+                refresh_item_index()
+            except Exception as e:
+                print("Item index refresh error:", e)
+            time.sleep(ITEM_INDEX_REFRESH)
+
+    threading.Thread(target=run, name="item-index-refresher", daemon=True).start()
+
+
+# -----------------------------
+# SALES ORDER FLOW
+# -----------------------------
+# Each step is one entry of the (use_case, action) table in flow_engine; next_actions lists
+# where the step may lead, handlers return the reply dict and handle_step turns it into JSON.
+flows = FlowRegistry()
+
+
+# --- Start flow ---
+@flows.step("sales_order", "start", next_actions=("customer_name",), entry=True)
+def sales_order_start(data, session_data):
+    return dict(
+        reply="Great! Let's create a Sales Order. Please provide the Customer Name:",
+        next_action="customer_name"
+    )
+
+
+# --- Customer name step ---
+@flows.step("sales_order", "customer_name", next_actions=("customer_name", "date"))
+def sales_order_customer_name(data, session_data):
+    flow_data = session_data.sales_order
+    customer_name = data.get("customer_name")
+    if not customer_name:
+        return dict(reply="Please provide a valid Customer Name.", next_action="customer_name")
+
+    flow_data.customer_name = customer_name
+
+    customer_code = get_customer_code_from_db(customer_name)
+    if customer_code:
+        flow_data.customer_code = customer_code
+        msg = f"Customer recorded: {customer_name} (Code: {customer_code})."
+        return dict(
+            reply=f"{msg} Now, please provide Document Date (YYYY-MM-DD):",
+            next_action="date",
+            customer_code=customer_code  # lets the interface rank item suggestions for this customer
+        )
+    else:
+        # Customer not found → ask again
+        return dict(
+            reply=f"❌ Customer '{customer_name}' not found in database. Please try again with a valid Customer Name:",
+            next_action="customer_name"
+        )
 
 
-    # --- Confirm step ---
-    if action == "confirm":
-        # Here you would finalize the order, e.g., save to DB
-        # For now, just acknowledge
+# --- Date step ---
+@flows.step("sales_order", "date", next_actions=("date", "itm_description"))
+def sales_order_date(data, session_data):
+    flow_data = session_data.sales_order
+    document_date = data.get("document_date")
+    if not document_date:
+        return dict(reply="Please provide a valid document date (YYYY-MM-DD).", next_action="date")
+    
+    # Try to parse multiple date formats and convert to yyyy-mm-dd
+    parsed_date = None
+    possible_formats = [
+        "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%m-%d-%Y", "%m/%d/%Y",
+        "%Y-%b-%d", "%Y-%B-%d",  # 2020-Jan-16 / 2020-January-16
+        "%d-%b-%Y", "%d-%B-%Y",  # 30-Dec-2025 / 30-December-2025
+        "%d-%b-%y", "%d-%B-%y",  # 15-Jul-05 / 15-July-05
+        "%Y/%b/%d", "%d/%b/%Y", "%d/%B/%Y"
+    ]
+    for fmt in possible_formats:
+        try:
+            parsed_date = datetime.strptime(document_date, fmt)
+            break
+        except ValueError:
+            continue
+
+    if not parsed_date:
+        return dict(
+            reply="⚠️ Invalid date format. Please enter the date in YYYY-MM-DD format (e.g., 2025-10-29).",
+            next_action="date"
+        )
 
-        print(data)
-        print(flow_data)
+    normalized_date = parsed_date.strftime("%Y-%m-%d")
+    flow_data.document_date = normalized_date
+    return dict(
+        reply=f"Date recorded as {normalized_date}. Please provide the first Item Description:",
+        next_action="itm_description"
+    )
+
+
+# --- Item description step ---
+@flows.step("sales_order", "itm_description", next_actions=("itm_description", "quantity"))
+def sales_order_itm_description(data, session_data):
+    flow_data = session_data.sales_order
+    itm_description = data.get("itm_description")
+    if not itm_description:
+        return dict(reply="Please provide a valid item description.", next_action="itm_description")
+
+    item_details = get_item_details_from_db(itm_description)
+    if item_details:
+        flow_data.current_item = OrderLine(
+            item_code=item_details["ItemCode"],
+            item_name=item_details["ItemName"],
+            price_unit=item_details["PriceUnit"]
+        )
+        msg = f"Item recorded: {item_details['ItemName']} (Code: {item_details['ItemCode']}, Unit Price: {item_details['PriceUnit']})."
+        return dict(
+            reply=f"{msg} Now, please enter Item Quantity:",
+            next_action="quantity"
+        )
+    else:
+        # Item not found → ask again, offering close names to type back (never picked for the user)
+        suggestions = suggest_item_names(itm_description)
+        hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+        return dict(
+            reply=f"❌ Item '{itm_description}' not found in database.{hint} Please enter a valid Item Description:",
+            next_action="itm_description"
+        )
 
-        user_response = data.get("confirm", "").strip().lower()
-        print(user_response)
-        if user_response in ["confirm", "yes", "y"]:
-            return jsonify(
-                reply="✅ Sales Order confirmed and saved successfully!",
-                next_action="end"
-            )
-        else:
-            return jsonify(
-                reply="Please reply with 'Confirm'",
+
+# --- Quantity step ---
+@flows.step("sales_order", "quantity", next_actions=("quantity", "itm_description", "add_more_items"))
+def sales_order_quantity(data, session_data):
+    flow_data = session_data.sales_order
+    quantity = data.get("quantity")
+    if not quantity:
+        return dict(reply="Please provide a valid quantity.", next_action="quantity")
+
+    if flow_data.current_item is None:
+        return dict(reply="No current item found. Please add item description first.", next_action="itm_description")
+
+    flow_data.current_item.quantity = quantity
+    flow_data.items.append(flow_data.current_item)
+    flow_data.current_item = None
+
+    count = len(flow_data.items)
+    return dict(
+        reply=f"Item #{count} added successfully! Do you want to add another item? (yes/no)",
+        next_action="add_more_items"
+    )
+
+
+# --- Add more items decision ---
+@flows.step("sales_order", "add_more_items", next_actions=("add_more_items", "itm_description", "preview"))
+def sales_order_add_more_items(data, session_data):
+    flow_data = session_data.sales_order
+    user_response = data.get("add_more_items", "").strip().lower()
+    if user_response in ["yes", "y"]:
+        return dict(
+            reply="Okay, please provide the next Item Description:",
+            next_action="itm_description"
+        )
+    elif user_response in ["no", "n"]:
+        return dict(
+            reply="Alright! Preparing Sales Order summary... Type 'VIEW' to show details",
+            next_action="preview"
+        )
+    else:
+        return dict(reply="Please reply with 'yes' or 'no'.", next_action="add_more_items")
+    
+
+
+# --- Preview step ---
+@flows.step("sales_order", "preview", next_actions=("confirm",))
+def sales_order_preview(data, session_data):
+    flow_data = session_data.sales_order
+    customer_name = flow_data.customer_name or ""
+    customer_code = flow_data.customer_code or ""
+    document_date = flow_data.document_date or ""
+    items = flow_data.items
+
+    # Prepare fallback text
+    summary_lines = [
+        f"Customer: {customer_name} (Code: {customer_code})",
+        f"Document Date: {document_date}",
+        "Items:"
+    ]
+    for idx, item in enumerate(items, start=1):
+        summary_lines.append(
+            f"  {idx}. {item.item_name} (Code: {item.item_code}, Qty: {item.quantity}, UnitPrice: {item.price_unit})"
+        )
+    summary_text = "✅ Sales Order Preview:\n" + "\n".join(summary_lines)
+
+    # Prepare clean HTML table layout
+    html_items = ""
+    for i, item in enumerate(items, start=1):
+        html_items += f"""
+            <tr class='border-b border-gray-200'>
+                <td class='px-4 py-2 text-center text-gray-800 font-medium'>{i}</td>
+                <td class='px-4 py-2 text-gray-700'>{item.item_name}</td>
+                <td class='px-4 py-2 text-center text-gray-700'>{item.item_code}</td>
+                <td class='px-4 py-2 text-center text-gray-700'>{item.quantity}</td>
+                <td class='px-4 py-2 text-center text-gray-700'>{item.price_unit}</td>
+                <td class='px-4 py-2 text-center'>
+                    <button 
+                        class='bg-red-500 hover:bg-red-600 text-white px-3 py-1 rounded text-sm'
+                        onclick="deleteItem({i})">
+                        Delete
+                    </button>
+                </td>
+            </tr>
+        """
+
+
+
+    reply_html = f"""
+    <div id='preview-container' style="font-family:sans-serif;">
+    <div class='bg-white border border-gray-300 rounded-xl shadow-md p-4 w-full max-w-2xl'>
+        <h3 class='text-lg font-bold text-primary mb-3'>✅ Sales Order Preview</h3>
+        <div class='text-gray-700 mb-2'><span class='font-semibold'>Customer:</span> {customer_name} ({customer_code})</div>
+        <div class='text-gray-700 mb-4'><span class='font-semibold'>Document Date:</span> {document_date}</div>
+
+        <div class='overflow-x-auto'>
+            <table class='min-w-full border border-gray-200 text-sm'>
+                <thead class='bg-gray-100 text-gray-800 font-semibold'>
+                    <tr>
+                        <th class='px-4 py-2 text-left'>#</th>
+                        <th class='px-4 py-2 text-left'>Item Name</th>
+                        <th class='px-4 py-2 text-left'>Code</th>
+                        <th class='px-4 py-2 text-left'>Qty</th>
+                        <th class='px-4 py-2 text-left'>Unit Price</th>
+                        <th class='px-4 py-2 text-left'>Action</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    {html_items}
+                </tbody>
+            </table>
+        </div><br>
+        <div class='text-gray-700 mb-2'><span>Please type <b>Confirm</b> for SAP posting</span></div>
+    </div>
+    </div>
+    """
+
+    return {
+        "reply": summary_text,   # Fallback
+        "reply_html": reply_html, # Rich formatted version
+        "next_action": "confirm", # <-- move to final confirm next
+        "summary_data": flow_data.to_dict()
+    }
+
+
+# --- Delete item step ---
+# Only reachable from the preview table, so every outcome goes back to waiting for the confirmation
+@flows.step("sales_order", "delete_item", next_actions=("confirm",), accepted_in=("confirm",))
+def sales_order_delete_item(data, session_data):
+    flow_data = session_data.sales_order
+    delete_index = data.get("delete_index")
+    if delete_index is None:
+        return dict(reply="Please specify which item number to delete.", next_action="confirm")
+
+    try:
+        delete_index = int(delete_index)
+        items = flow_data.items
+
+        # 🛑 Prevent deleting if only one item left
+        if len(items) <= 1:
+            return dict(
+                reply="⚠️ You must have at least one item in the Sales Order. Cannot delete the last remaining item.",
                 next_action="confirm"
             )
 
+        if delete_index < 1 or delete_index > len(items):
+            return dict(reply=f"⚠️ Invalid item number: {delete_index}.", next_action="confirm")
 
+        removed_item = items.pop(delete_index - 1)
+        reply_msg = f"🗑️ Deleted item #{delete_index}: {removed_item.item_name}."
 
+        # Return updated preview after deletion
+        return sales_order_preview(data, session_data)
 
+    except Exception as e:
+        print("Delete item error:", e)
+        return dict(reply="⚠️ Something went wrong deleting the item.", next_action="confirm")
 
 
+# --- Confirm step ---
+@flows.step("sales_order", "confirm", next_actions=("confirm", "end"))
+def sales_order_confirm(data, session_data):
+    flow_data = session_data.sales_order
+    # Here you would finalize the order, e.g., save to DB
+    # For now, just acknowledge
 
-def invoice_flow(action, data):
-    flow_data = user_data["invoice"]
+    print(data)
+    print(flow_data)
 
-    if action == "start":
-        return jsonify(
-            reply="Great! Let's create a Invoice. Please provide the invoice number:",
-            next_action="invoice_number"
+    user_response = data.get("confirm", "").strip().lower()
+    print(user_response)
+    if user_response in ["confirm", "yes", "y"]:
+        # Order-frequency counters behind the popularity ranking of the autocomplete
+        try:
+            record_order(flow_data.customer_code, [item.item_code for item in flow_data.items])
+        except redis.RedisError as e:
+            print("Redis popularity error:", e)
+        return dict(
+            reply="✅ Sales Order confirmed and saved successfully!",
+            next_action="end"
+        )
+    else:
+        return dict(
+            reply="Please reply with 'Confirm'",
+            next_action="confirm"
         )
 
-    # Invoice number step
-    if action == "invoice_number":
-        invoice_number = data.get("invoice_number")
-        if not invoice_number:
-            return jsonify(reply="Please provide a valid invoice number.", next_action="invoice_number")
 
-        flow_data["invoice_number"] = invoice_number
+# -----------------------------
+# INVOICE FLOW
+# -----------------------------
+@flows.step("invoice", "start", next_actions=("invoice_number",), entry=True)
+def invoice_start(data, session_data):
+    return dict(
+        reply="Great! Let's create a Invoice. Please provide the invoice number:",
+        next_action="invoice_number"
+    )
 
-        print(user_data)
-        return jsonify(
-            reply=f"Invoice Number: {invoice_number} Now, please provide Document Date (YYYY-MM-DD):",
-            next_action="date"
-        )
 
-    # Document date step
-    if action == "date":
-        document_date = data.get("document_date")
-        if not document_date:
-            return jsonify(reply="Please provide a valid document date.", next_action="date")
-        flow_data["document_date"] = document_date
-        summary = f"Date: {flow_data.get('document_date')} Type 'VIEW' to see all details:"
+# Invoice number step
+@flows.step("invoice", "invoice_number", next_actions=("invoice_number", "date"))
+def invoice_invoice_number(data, session_data):
+    flow_data = session_data.invoice
+    invoice_number = data.get("invoice_number")
+    if not invoice_number:
+        return dict(reply="Please provide a valid invoice number.", next_action="invoice_number")
 
-        return jsonify(reply=summary, next_action="confirm")
+    flow_data.invoice_number = invoice_number
 
+    return dict(
+        reply=f"Invoice Number: {invoice_number} Now, please provide Document Date (YYYY-MM-DD):",
+        next_action="date"
+    )
+
+
+# Document date step
+@flows.step("invoice", "date", next_actions=("date", "confirm"))
+def invoice_date(data, session_data):
+    flow_data = session_data.invoice
+    document_date = data.get("document_date")
+    if not document_date:
+        return dict(reply="Please provide a valid document date.", next_action="date")
+    flow_data.document_date = document_date
+    summary = f"Date: {flow_data.document_date} Type 'VIEW' to see all details:"
+
+    return dict(reply=summary, next_action="confirm")
 
-    if action == "confirm":
-        summary = (
-            f"✅ Invoice Summary:\n"
-            f"Invoice Number: {flow_data.get('invoice_number')}\n"
-            f"Document Date: {flow_data.get('document_date')}\n"
-        )
-        return jsonify(reply=summary, next_action="end")
 
-    return jsonify(reply="Invalid step in Invoice flow.", next_action="start")
+# Confirm step
+@flows.step("invoice", "confirm", next_actions=("end",))
+def invoice_confirm(data, session_data):
+    flow_data = session_data.invoice
+    summary = (
+        f"✅ Invoice Summary:\n"
+        f"Invoice Number: {flow_data.invoice_number}\n"
+        f"Document Date: {flow_data.document_date}\n"
+    )
+    return dict(reply=summary, next_action="end")
 
 
+# Fails at import if a step leads to a step that is not registered
+flows.validate()
+FLOWS = frozenset(flows.flows())
 
 
 @app.route("/chatbot", methods=["POST"])
 def chatbot():
     data = request.json
     session_id = data.get("session_id")  # unique id from frontend
+    # Same key on every retry of one message (body "request_id" or Idempotency-Key header)
+    request_id = data.get("request_id") or request.headers.get("Idempotency-Key")
+
+    # One request per session at a time, so a retry waits for the slow original instead of racing it
+    try:
+        with session_store.lock(session_id):
+            return run_step(session_id, request_id, data)
+    except SessionLocked:
+        return jsonify(
+            reply="⏳ Still working on your previous message. Please wait a moment.",
+            next_action=data.get("action")
+        ), 409
+
+
+def run_step(session_id, request_id, data):
+    # Optimistic concurrency: run the step on the loaded session and save it only if no other
+    # request saved the same session meanwhile; otherwise re-run on the fresh copy
+    for _ in range(SESSION_SAVE_RETRIES):
+        wire, version = session_store.load(session_id)
+        session_data = ChatSession.from_wire(wire) if wire is not None else ChatSession()
+
+        if request_id and request_id == session_data.last_request_id:
+            # Already applied (the client retried a slow request): replay, no lookups, no state change
+            status, body = session_data.last_response
+            response = jsonify(body)
+            response.status_code = status
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+
+        response = handle_step(data, session_data)
+        if request_id:
+            session_data.last_request_id = request_id
+            session_data.last_response = [response.status_code, response.get_json()]
+        if session_store.save(session_id, session_data.to_wire(), version):
+            return response
+
+    return jsonify(
+        reply="⚠️ This conversation was updated from somewhere else. Please send that again.",
+        next_action=data.get("action")
+    ), 409
+
+
+def handle_step(data, session_data):
     action = data.get("action")
     use_case = data.get("use_case")  # sales_order / invoice / other
 
-    # Create session if not exist
-    if session_id not in user_data:
-        user_data[session_id] = {
-            "use_case": None,
-            "sales_order": {},
-            "invoice": {},
-            "other": {}
-        }
-
-    session_data = user_data[session_id]
-
     # Update use_case
     if use_case:
-        session_data["use_case"] = use_case
+        session_data.use_case = use_case
 
-    # Route flows per session
-    if session_data["use_case"] == "sales_order":
-        return sales_order_flow(action, data, session_data)
-    elif session_data["use_case"] == "invoice":
-        return invoice_flow(action, data, session_data)
-    else:
+    # Route flows per session: one lookup of (use_case, action) in the step table
+    if session_data.use_case not in FLOWS:
         return jsonify(reply="Something went wrong. Please start again.", next_action="start")
+    return jsonify(flows.dispatch(session_data.use_case, action, data, session_data))
+
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    return jsonify(
+        customers=customer_cache.stats(),
+        items=item_cache.stats(),
+        customer_misses=customer_misses.stats(),
+        item_misses=item_misses.stats(),
+        customer_flights=customer_flight.stats(),
+        item_flights=item_flight.stats()
+    )
+
+
+@app.route("/sessions/stats")
+def session_stats():
+    """Live sessions and the memory they hold (memory backend), or the Redis TTL"""
+    return jsonify(session_store.stats())
+
+
+@app.route("/cache/invalidate", methods=["POST"])
+def cache_invalidate():
+    invalidate_lookup_caches()
+    return jsonify(status="ok")
 
 
 
 if __name__ == "__main__":
+    start_item_index_refresher()
+    session_store.start_sweeper()
     app.run(host="0.0.0.0", port=5001, debug=True)
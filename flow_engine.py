@@ -0,0 +1,85 @@
+from dataclasses import dataclass
+
+
+# Table-driven chat flows: every step of every flow is one entry in a dict keyed by
+# (use_case, action), so a turn is one lookup no matter how many steps or flows exist.
+#
+#   flows = FlowRegistry()
+#
+#   @flows.step("invoice", "invoice_number", next_actions=("invoice_number", "date"))
+#   def invoice_number(data, session_data):
+#       ...
+#       return dict(reply="...", next_action="date")
+#
+# Transitions are checked both ways: an incoming action must be the one the session waits
+# for (ChatSession.step) or be accepted in that state, and a handler may only hand back
+# one of its declared next_actions. validate() checks the table itself once at startup.
+END = "end"  # next_action that finishes a flow; only entry steps (start) are accepted after it
+
+
+class InvalidTransition(Exception):
+    """A handler returned a next_action it did not declare, or the table references unknown steps."""
+
+
+@dataclass(slots=True, frozen=True)
+class Step:
+    handler: object          # fn(data, session_data) -> dict with "reply" and "next_action"
+    next_actions: frozenset  # what the handler may ask for next
+    accepted_in: frozenset | None  # pending steps in which this action is valid; None = any (entry step)
+
+
+class FlowRegistry:
+    """(use_case, action) -> Step; new flows register their steps, the router stays the same."""
+
+    def __init__(self):
+        self._steps = {}
+
+    def step(self, use_case, action, next_actions, accepted_in=None, entry=False):
+        """Decorator registering `handler` for `action` of `use_case`.
+
+        By default the action is only accepted when it is the step the session waits for;
+        `accepted_in` adds other pending steps (e.g. deleting a line while waiting for the
+        confirmation), `entry=True` accepts it in any state.
+        """
+        def register(handler):
+            key = (use_case, action)
+            if key in self._steps:
+                raise ValueError(f"Step {action!r} of {use_case!r} is already registered")
+            states = None if entry else frozenset((action, *(accepted_in or ())))
+            self._steps[key] = Step(handler, frozenset(next_actions), states)
+            return handler
+        return register
+
+    def validate(self):
+        """Every declared next_action must be a step of the same flow (or END)"""
+        for (use_case, action), step in self._steps.items():
+            unknown = {n for n in step.next_actions if n != END and (use_case, n) not in self._steps}
+            if unknown:
+                raise InvalidTransition(f"{use_case}.{action} leads to unknown steps: {sorted(unknown)}")
+
+    def flows(self):
+        return sorted({use_case for use_case, _ in self._steps})
+
+    def dispatch(self, use_case, action, data, session_data):
+        """Run one turn; returns the reply dict and records its next_action as session_data.step"""
+        step = self._steps.get((use_case, action))
+        if step is None:
+            flow = use_case.replace("_", " ").title() if use_case else "this"
+            return dict(reply=f"Invalid step in {flow} flow.", next_action=session_data.step or "start")
+
+        if step.accepted_in is not None and session_data.step not in step.accepted_in:
+            # Out of order (stale tab, replayed message): repeat what the flow is waiting for
+            return dict(
+                reply="⚠️ That step is not expected right now. Please continue where we left off.",
+                next_action=session_data.step or "start"
+            )
+
+        reply = step.handler(data, session_data)
+        next_action = reply.get("next_action")
+        if next_action not in step.next_actions:
+            raise InvalidTransition(f"{use_case}.{action} returned undeclared next_action {next_action!r}")
+        session_data.step = next_action
+        return reply
+
+    def __len__(self):
+        return len(self._steps)
@@ -0,0 +1,186 @@
+from hdbcli import dbapi  # SAP HANA client
+from dotenv import load_dotenv
+from contextlib import contextmanager
+import threading
+import queue
+import time
+import os
+
+load_dotenv()
+
+# --- CONFIG ---
+HANA_HOST = os.getenv("DB_ADDRESS")
+HANA_PORT = os.getenv("DB_PORT")
+HANA_USER = os.getenv("DB_USER")
+HANA_PASS = os.getenv("DB_PASSWORD")
+
+HANA_POOL_SIZE = int(os.getenv("HANA_POOL_SIZE", "5"))              # max open connections
+HANA_POOL_TIMEOUT = float(os.getenv("HANA_POOL_TIMEOUT", "10"))     # seconds to wait for a free connection
+HANA_POOL_RECYCLE = float(os.getenv("HANA_POOL_RECYCLE", "1800"))   # reconnect after this many seconds
+HANA_POOL_PING_IDLE = float(os.getenv("HANA_POOL_PING_IDLE", "30")) # ping on checkout if idle longer than this
+
+
+class PoolTimeout(Exception):
+    """Raised when no HANA connection becomes free within the checkout timeout."""
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class HanaConnectionPool:
+    """Bounded, thread-safe pool of SAP HANA connections.
+
+    Connections are handed out LIFO so the warmest one is reused first, health-checked
+    on checkout and replaced once they are older than `recycle` seconds.
+    """
+
+    def __init__(self, address, port, user, password,
+                 size=HANA_POOL_SIZE, timeout=HANA_POOL_TIMEOUT,
+                 recycle=HANA_POOL_RECYCLE, ping_idle=HANA_POOL_PING_IDLE):
+        self._connect_args = dict(address=address, port=port, user=user, password=password)
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_idle = ping_idle
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)  # one slot per open connection
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # Counters for monitoring / benchmarking
+        self.opened = 0
+        self.recycled = 0
+        self.checkouts = 0
+
+    # -----------------------------
+    # INTERNALS
+    # -----------------------------
+    def _open(self):
+        conn = dbapi.connect(**self._connect_args)
+        with self._lock:
+            self.opened += 1
+        return _PooledConnection(conn)
+
+    def _discard(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, pooled):
+        now = time.monotonic()
+        if now - pooled.created_at > self.recycle:
+            return False
+        try:
+            if not pooled.conn.isconnected():
+                return False
+            if now - pooled.last_used > self.ping_idle:
+                cursor = pooled.conn.cursor()
+                cursor.execute("SELECT 1 FROM DUMMY")
+                cursor.fetchone()
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def _checkout(self):
+        if self._closed:
+            raise PoolTimeout("HANA connection pool is closed")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"No HANA connection free after {self.timeout}s (pool size {self.size})")
+
+        try:
+            while True:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    pooled = self._open()
+                    break
+
+                if self._is_healthy(pooled):
+                    break
+
+                # Stale or broken → drop it and try the next idle one
+                self._discard(pooled)
+                with self._lock:
+                    self.recycled += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.checkouts += 1
+        return pooled
+
+    def _checkin(self, pooled, broken=False):
+        try:
+            if broken or self._closed:
+                self._discard(pooled)
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle.put(pooled)
+        finally:
+            self._slots.release()
+
+    # -----------------------------
+    # PUBLIC API
+    # -----------------------------
+    @contextmanager
+    def connection(self):
+        """Borrow a connection: `with pool.connection() as conn: ...`"""
+        pooled = self._checkout()
+        try:
+            yield pooled.conn
+        except BaseException:
+            # Connection state is unknown after a failure (or an abandoned generator) → never reuse it
+            self._checkin(pooled, broken=True)
+            raise
+        else:
+            self._checkin(pooled)
+
+    def close(self):
+        """Close every idle connection; connections in use are closed on check-in."""
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "opened": self.opened,
+            "recycled": self.recycled,
+            "checkouts": self.checkouts,
+        }
+
+
+# -----------------------------
+# SHARED POOL
+# -----------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide HANA pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HanaConnectionPool(HANA_HOST, HANA_PORT, HANA_USER, HANA_PASS)
+    return _pool
+
+
+def hana_connection():
+    """Shortcut for `get_pool().connection()`."""
+    return get_pool().connection()
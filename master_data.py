@@ -0,0 +1,187 @@
+from dotenv import load_dotenv
+from name_index import normalize_name
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+import redis
+import os
+
+load_dotenv()
+
+# --- CONFIG ---
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+POPULARITY_TOP = int(os.getenv("POPULARITY_TOP", "5000"))  # most-ordered codes read back per counter
+
+# Fail fast when Redis is down, so callers with a fallback (chat_v7 -> HANA) get to it quickly
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5"))  # seconds to open a connection
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "10"))     # seconds per reply; bulk pipelines included
+REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", "1"))                      # immediate retries after a connection error
+
+
+def redis_client(**options):
+    """StrictRedis with bounded connect time and retries (redis-py's default retries with backoff take seconds)"""
+    return redis.StrictRedis(
+        host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT, socket_timeout=REDIS_SOCKET_TIMEOUT,
+        retry=Retry(NoBackoff(), REDIS_RETRIES), **options
+    )
+
+
+r = redis_client(decode_responses=True)
+
+
+# One entry per synced SAP table. Each full reload writes a new generation:
+# keys "<key_prefix><generation>:<code>" indexed by "<index>:v<generation>",
+# and the stable alias "<index>" is switched to it once it is complete.
+# "fields" maps extra hash fields to their SAP columns (besides name/code);
+# "suggest" is the FT.SUGADD dictionary used for keystroke autocomplete.
+MASTER_DATA = {
+    "customers": {"table": "OCRD", "code": "CardCode", "name": "CardName",
+                  "key_prefix": "customer:", "index": "idx:customers",
+                  "suggest": "sug:customers", "fields": {}},
+    "items": {"table": "OITM", "code": "ItemCode", "name": "ItemName",
+              "key_prefix": "item:", "index": "idx:items",
+              "suggest": "sug:items", "fields": {"price_unit": "PriceUnit"}},
+}
+
+
+def generation_prefix(spec, generation):
+    return f"{spec['key_prefix']}{generation}:"
+
+
+def current_generation(kind):
+    """Generation the alias currently points at (None before the first load)"""
+    return r.get(f"{kind}:generation")
+
+
+def version_keys(kind):
+    """Keys read by names_version (MGET them together)"""
+    return f"{kind}:generation", f"{kind}:revision"
+
+
+def format_version(generation, revision):
+    """"<generation>.<revision>", or None before the first load (no generation yet)"""
+    return f"{generation}.{revision or 0}" if generation else None
+
+
+def names_version(kind):
+    """"<generation>.<revision>" of the live names, or None before the first load.
+
+    Full reloads bump the generation, incremental syncs that change names bump the revision.
+    """
+    return format_version(*r.mget(*version_keys(kind)))
+
+
+# -----------------------------
+# SEARCH HELPERS
+# -----------------------------
+def escape_tag(value):
+    """Escape a TAG query value; normalized names only contain word characters and spaces"""
+    return value.replace(" ", "\\ ")
+
+
+def parse_search_results(res):
+    """FT.SEARCH reply [total, key, [field, value, ...], ...] -> list of field dicts"""
+    docs = []
+    for i in range(1, len(res), 2):
+        fields = res[i + 1]
+        docs.append(dict(zip(fields[::2], fields[1::2])))
+    return docs
+
+
+# -----------------------------
+# RESOLVERS
+# -----------------------------
+def resolve(kind, name):
+    """Exact (normalized) name -> stored hash fields from the live index, or None if unknown.
+
+    Raises redis.RedisError when Redis is unavailable so callers can fall back to HANA.
+    """
+    name_key = normalize_name(name)
+    if not name_key:
+        return None
+
+    res = r.execute_command(
+        "FT.SEARCH", MASTER_DATA[kind]["index"], f"@name_key:{{{escape_tag(name_key)}}}",
+        "LIMIT", "0", "1"
+    )
+    docs = parse_search_results(res)
+    return docs[0] if docs else None
+
+
+def resolve_customer(customer_name):
+    """Customer name -> {"code", "name"} or None"""
+    return resolve("customers", customer_name)
+
+
+def resolve_item(item_name):
+    """Item description -> {"ItemCode", "ItemName", "PriceUnit"} (chat_v7 item shape) or None"""
+    doc = resolve("items", item_name)
+    if not doc:
+        return None
+    return {
+        "ItemCode": doc["code"],
+        "ItemName": doc["name"],
+        "PriceUnit": doc.get("price_unit")
+    }
+
+
+# -----------------------------
+# POPULARITY
+# -----------------------------
+# Sorted sets of confirmed-order counts: "popularity:customers", "popularity:items"
+# and per customer "popularity:items:<CardCode>" (member = code, score = orders).
+# "popularity:<kind>:version" counts the orders recorded, so rankings have a stable version.
+def popularity_key(kind, customer_code=None):
+    return f"popularity:{kind}:{customer_code}" if customer_code else f"popularity:{kind}"
+
+
+def popularity_version_key(kind):
+    return f"popularity:{kind}:version"
+
+
+def record_order(customer_code, item_codes):
+    """Count one confirmed sales order for its customer and each distinct item (globally and per customer).
+
+    The FT.SUGADD entries of those names get +1 too, so /api/suggest ranks them higher.
+    """
+    codes = {"customers": [customer_code], "items": list(set(item_codes))}
+    names = _live_names(codes)
+
+    pipe = r.pipeline(transaction=False)
+    pipe.zincrby(popularity_key("customers"), 1, customer_code)
+    for code in set(item_codes):
+        pipe.zincrby(popularity_key("items"), 1, code)
+        pipe.zincrby(popularity_key("items", customer_code), 1, code)
+    for kind in ("customers", "items"):
+        pipe.incr(popularity_version_key(kind))
+        for code, name in zip(codes[kind], names[kind]):
+            if name:
+                pipe.execute_command("FT.SUGADD", MASTER_DATA[kind]["suggest"], name, 1, "INCR", "PAYLOAD", code)
+    pipe.execute()
+
+
+def _live_names(codes):
+    """kind -> names of `codes[kind]` in the live generation (None for unknown codes), one pipeline"""
+    pipe = r.pipeline(transaction=False)
+    for kind in codes:
+        pipe.get(f"{kind}:generation")
+    generations = dict(zip(codes, pipe.execute()))
+
+    pipe = r.pipeline(transaction=False)
+    for kind, kind_codes in codes.items():
+        for code in kind_codes:
+            pipe.hget(f"{generation_prefix(MASTER_DATA[kind], generations[kind])}{code}", "name")
+    names = iter(pipe.execute())
+    return {kind: [next(names) for _ in kind_codes] for kind, kind_codes in codes.items()}
+
+
+def popularity_version(kind):
+    """Changes exactly when an order is recorded ("0" before the first one)"""
+    return r.get(popularity_version_key(kind)) or "0"
+
+
+def popularity_scores(kind, customer_code=None, top=POPULARITY_TOP):
+    """code -> order count for the `top` most ordered codes"""
+    return dict(r.zrevrange(popularity_key(kind, customer_code), 0, top - 1, withscores=True))
@@ -0,0 +1,129 @@
+from bisect import bisect_left, insort
+import threading
+import re
+
+_PUNCT_RE = re.compile(r"[^\w]+|_+")
+
+
+def normalize_name(text):
+    """Casefold and collapse punctuation/whitespace: '  Cement, 50KG-Bag ' -> 'cement 50kg bag'"""
+    if not text:
+        return ""
+    return " ".join(_PUNCT_RE.sub(" ", text.casefold()).split())
+
+
+class NameIndex:
+    """In-process index of master-data records keyed by normalized name.
+
+    Exact lookups are a dict hit (O(1)); prefix lookups bisect a sorted key list
+    (O(log n) + matches). Records are dicts and must carry the code field given
+    as `code_field`, so renamed or deleted rows can be found again on refresh.
+    """
+
+    def __init__(self, code_field, name_field):
+        self.code_field = code_field
+        self.name_field = name_field
+        self._by_key = {}      # normalized name -> {code: record}
+        self._key_of = {}      # code -> normalized name
+        self._keys = []        # sorted normalized names
+        self._lock = threading.Lock()
+
+    # -----------------------------
+    # WRITES
+    # -----------------------------
+    def build(self, records):
+        """Replace the whole index; readers keep the old one until the swap."""
+        by_key, key_of = {}, {}
+        for rec in records:
+            key = normalize_name(rec[self.name_field])
+            if not key:
+                continue
+            by_key.setdefault(key, {})[rec[self.code_field]] = rec
+            key_of[rec[self.code_field]] = key
+        keys = sorted(by_key)
+
+        with self._lock:
+            self._by_key, self._key_of, self._keys = by_key, key_of, keys
+
+    def upsert(self, records):
+        """Insert or update records in place (renames move the record to its new key).
+
+        Returns how many records were new or differed; identical re-applied rows are skipped.
+        """
+        changed = 0
+        with self._lock:
+            for rec in records:
+                code = rec[self.code_field]
+                current_key = self._key_of.get(code)
+                if current_key is not None and self._by_key[current_key].get(code) == rec:
+                    continue
+                key = normalize_name(rec[self.name_field])
+                self._remove_code(code)
+                if not key:
+                    continue
+                if key not in self._by_key:
+                    self._by_key[key] = {}
+                    insort(self._keys, key)
+                self._by_key[key][code] = rec
+                self._key_of[code] = key
+                changed += 1
+        return changed
+
+    def retain(self, codes):
+        """Drop every record whose code is not in `codes` (rows deleted at source)."""
+        codes = set(codes)
+        with self._lock:
+            stale = [code for code in self._key_of if code not in codes]
+            for code in stale:
+                self._remove_code(code)
+        return len(stale)
+
+    def _remove_code(self, code):
+        key = self._key_of.pop(code, None)
+        if key is None:
+            return
+        bucket = self._by_key.get(key)
+        if bucket is not None:
+            bucket.pop(code, None)
+            if not bucket:
+                del self._by_key[key]
+                pos = bisect_left(self._keys, key)
+                if pos < len(self._keys) and self._keys[pos] == key:
+                    del self._keys[pos]
+
+    # -----------------------------
+    # READS
+    # -----------------------------
+    def _first(self, bucket):
+        # Same normalized name on several codes → answer deterministically
+        return bucket[min(bucket)]
+
+    def exact(self, name):
+        key = normalize_name(name)
+        with self._lock:
+            bucket = self._by_key.get(key)
+            return self._first(bucket) if bucket else None
+
+    def prefix(self, name, limit=10):
+        prefix = normalize_name(name)
+        if not prefix:
+            return []
+        results = []
+        with self._lock:
+            keys, by_key = self._keys, self._by_key
+            pos = bisect_left(keys, prefix)
+            while pos < len(keys) and len(results) < limit:
+                key = keys[pos]
+                if not key.startswith(prefix):
+                    break
+                results.append(self._first(by_key[key]))
+                pos += 1
+        return results
+
+    def records(self):
+        """Snapshot of every record (one per code)"""
+        with self._lock:
+            return [rec for bucket in self._by_key.values() for rec in bucket.values()]
+
+    def __len__(self):
+        return len(self._key_of)
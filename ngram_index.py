@@ -0,0 +1,88 @@
+from name_index import normalize_name
+from array import array
+import numpy as np
+
+
+def trigrams(text, pad_end=True):
+    """Character trigrams of a normalized name, padded so word starts count extra.
+
+    Queries are not padded at the end: "cem" should still match "cement".
+    """
+    text = " " + text + (" " if pad_end else "")
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Typo-tolerant, ranked name search over character trigrams.
+
+    Postings are one numpy array of name ids grouped by trigram, so scoring a query
+    is a single np.bincount over the postings of its trigrams (no per-row Python loop).
+    Score = 0.7 * coverage (share of the query's trigrams found in the name)
+          + 0.3 * Dice similarity (penalizes names much longer than the query).
+    The index is immutable: rebuild it and swap the reference to update.
+    """
+
+    __slots__ = ("_names", "_refs", "_gram_ids", "_starts", "_postings", "_gram_counts")
+
+    def __init__(self, records=()):
+        """records: iterable of (ref, name); `ref` is returned with each hit (a code or a record)"""
+        names, refs = [], []
+        gram_ids = {}
+        pair_grams, pair_names = array("I"), array("I")
+        gram_counts = array("H")
+
+        for ref, name in records:
+            key = normalize_name(name)
+            if not key:
+                continue
+            nid = len(names)
+            names.append(name)
+            refs.append(ref)
+            grams = trigrams(key)
+            gram_counts.append(min(len(grams), 65535))
+            for gram in grams:
+                gid = gram_ids.setdefault(gram, len(gram_ids))
+                pair_grams.append(gid)
+                pair_names.append(nid)
+
+        pair_grams = np.frombuffer(pair_grams, dtype=np.uint32)
+        pair_names = np.frombuffer(pair_names, dtype=np.uint32)
+        order = np.argsort(pair_grams, kind="stable")
+
+        self._names = names
+        self._refs = refs
+        self._gram_ids = gram_ids
+        # Postings of trigram g are _postings[_starts[g]:_starts[g + 1]]
+        self._postings = pair_names[order].astype(np.int32)
+        self._starts = np.concatenate(([0], np.cumsum(np.bincount(pair_grams, minlength=len(gram_ids)))))
+        self._gram_counts = np.frombuffer(gram_counts, dtype=np.uint16).astype(np.float32)
+
+    def search(self, query, limit=10, min_score=0.0):
+        """Top `limit` matches as (score, name, ref), best first"""
+        key = normalize_name(query)
+        if not key or not self._names:
+            return []
+
+        grams = trigrams(key, pad_end=False)
+        gids = [self._gram_ids[g] for g in grams if g in self._gram_ids]
+        if not gids:
+            return []
+
+        starts = self._starts
+        postings = np.concatenate([self._postings[starts[g]:starts[g + 1]] for g in gids])
+        hits = np.bincount(postings, minlength=len(self._names)).astype(np.float32)
+
+        query_len = float(len(grams))
+        scores = 0.7 * (hits / query_len) + 0.3 * (2.0 * hits / (query_len + self._gram_counts))
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [
+            (float(scores[i]), self._names[i], self._refs[i])
+            for i in top if scores[i] > 0 and scores[i] >= min_score
+        ]
+
+    def __len__(self):
+        return len(self._names)
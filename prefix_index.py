@@ -0,0 +1,97 @@
+from bisect import bisect_left
+from array import array
+from name_index import normalize_name
+
+
+class PrefixIndex:
+    """Pure-Python sorted-array prefix index over customer/item names.
+
+    Serves autocomplete without RediSearch. Every word start of a normalized name is
+    an entry, so "cem" finds "Portland Cement 50kg" like RediSearch's "cem*" does.
+    Entries are not stored as strings: two parallel arrays hold (name id, word offset)
+    sorted by the suffix they point at, and bisect compares against slices on the fly.
+
+    Measured with bench_prefix_index.py (CPython 3.11, synthetic 2-5 word SAP-style names):
+
+        names     entries    held      peak while building   build    lookup p50 / p99
+        100,000   ~450,000   ~25 MiB   ~80 MiB               ~1.5 s   ~25 us / ~50-150 us
+        250,000   ~1.1 M     ~61 MiB   ~200 MiB              ~4.6 s   ~27 us / ~60 us
+
+    Held memory is mostly the display and normalized name strings; the arrays add
+    6 bytes per entry. The build peak comes from the temporary (id, offset) list.
+    The index is immutable: rebuild it and swap the reference to update.
+    """
+
+    __slots__ = ("_names", "_codes", "_norm", "_nids", "_offsets")
+
+    def __init__(self, records=()):
+        """records: iterable of (code, name)"""
+        names, codes, norm = [], [], []
+        entries = []
+        for code, name in records:
+            key = normalize_name(name)
+            if not key:
+                continue
+            nid = len(names)
+            names.append(name)
+            codes.append(code)
+            norm.append(key)
+            entries.append((nid, 0))
+            pos = key.find(" ")
+            while pos != -1:
+                entries.append((nid, pos + 1))
+                pos = key.find(" ", pos + 1)
+
+        entries.sort(key=lambda e: norm[e[0]][e[1]:])
+
+        self._names = names
+        self._codes = codes
+        self._norm = norm
+        self._nids = array("I", (e[0] for e in entries))
+        self._offsets = array("H", (e[1] for e in entries))
+
+    def _suffix(self, i):
+        return self._norm[self._nids[i]][self._offsets[i]:]
+
+    def search(self, prefix, limit=10, with_codes=False):
+        """Up to `limit` names with a word starting with `prefix`, whole-name matches first.
+
+        With `with_codes`, (code, name) pairs instead of bare names.
+        """
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+
+        nids, offsets, norm = self._nids, self._offsets, self._norm
+        pos = bisect_left(range(len(nids)), prefix, key=self._suffix)
+
+        leading, inner, seen = [], [], set()
+        while pos < len(nids) and len(seen) < limit:
+            nid, offset = nids[pos], offsets[pos]
+            if not norm[nid].startswith(prefix, offset):
+                break
+            if nid not in seen:
+                seen.add(nid)
+                (leading if offset == 0 else inner).append(nid)
+            pos += 1
+
+        if with_codes:
+            return [(self._codes[nid], self._names[nid]) for nid in (leading + inner)[:limit]]
+        return [self._names[nid] for nid in (leading + inner)[:limit]]
+
+    def code_of(self, name):
+        """Code for an exact (normalized) name, or None"""
+        key = normalize_name(name)
+        pos = bisect_left(range(len(self._nids)), key, key=self._suffix)
+        while pos < len(self._nids) and self._suffix(pos) == key:
+            if self._offsets[pos] == 0:
+                return self._codes[self._nids[pos]]
+            pos += 1
+        return None
+
+    def records(self):
+        """(code, name) of every indexed name, e.g. to build an updated index without the source"""
+        return list(zip(self._codes, self._names))
+
+    def __len__(self):
+        return len(self._names)
@@ -1,191 +1,1159 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from hdbcli import dbapi  
 from dotenv import load_dotenv
+from hana_pool import hana_connection
+from master_data import (
+    r, MASTER_DATA, POPULARITY_TOP, generation_prefix, current_generation, parse_search_results, resolve,
+    popularity_key, popularity_scores, popularity_version_key, names_version
+)
+from name_index import normalize_name
+from prefix_index import PrefixIndex
+from ngram_index import TrigramIndex
+from lookup_cache import TTLCache
+from datetime import datetime
+import threading
+import hashlib
+import hmac
+import base64
+import gzip
+import json
 import redis
+import time
 import os
 
+try:
+    import resource  # peak RSS in load reports; not available on Windows
+except ImportError:
+    resource = None
+
+try:
+    import brotli  # optional: smaller snapshots for browsers that accept "br"
+except ImportError:
+    brotli = None
+
+try:
+    from flask_sock import Sock  # optional: WebSocket autocomplete channel (/ws/autocomplete)
+except ImportError:
+    Sock = None
+
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
+sock = Sock(app) if Sock is not None else None
 
 # --- CONFIG ---
-HANA_HOST = os.getenv("DB_ADDRESS")
-HANA_PORT = os.getenv("DB_PORT")
-HANA_USER = os.getenv("DB_USER")
-HANA_PASS = os.getenv("DB_PASSWORD")
+HANA_SCHEMA = "MJENGO_TEST_020725"
+SYNC_INTERVAL = float(os.getenv("SYNC_INTERVAL", "300"))  # seconds between incremental syncs, 0 = off
+SYNC_TOKEN = os.getenv("SYNC_TOKEN", "")  # required in X-Sync-Token by POST /api/sync; unset = loopback callers only
+LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", "5000"))  # rows per fetchmany / Redis pipeline
+SUGGEST_WEIGHT = 1.0  # base FT.SUGADD score of every name; confirmed orders of the code are added on top
+SUGGEST_MAX = 50      # upper bound for ?max= on /api/suggest
+
+AUTOCOMPLETE_BACKEND = os.getenv("AUTOCOMPLETE_BACKEND", "redisearch")  # "redisearch", "memory" or "ngram"
+MEMORY_INDEX = os.getenv("MEMORY_INDEX", "1") == "1"  # keep in-process Prefix/Trigram indexes (backend + fallback)
+FUZZY_MIN_SCORE = float(os.getenv("FUZZY_MIN_SCORE", "0.5"))  # weakest typo-tolerant suggestion still shown
+INDEX_FOLLOW_INTERVAL = float(os.getenv("INDEX_FOLLOW_INTERVAL", "30"))  # reader processes: seconds between index checks
+
+AUTOCOMPLETE_CACHE_SIZE = int(os.getenv("AUTOCOMPLETE_CACHE_SIZE", "10000"))  # cached (index, prefix, limit) answers
+AUTOCOMPLETE_CACHE_TTL = float(os.getenv("AUTOCOMPLETE_CACHE_TTL", "60"))     # bounds staleness across processes
+# Sent with every suggestion list; browsers/proxies revalidate with If-None-Match after max-age
+AUTOCOMPLETE_CACHE_CONTROL = os.getenv("AUTOCOMPLETE_CACHE_CONTROL", "public, max-age=30")
+DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", "1"))  # seconds an ETag's data version is reused before re-reading Redis
+
+# Whole-table name lists for client-side filtering; bigger tables answer 413 and clients keep using /api/*
+SNAPSHOT_MAX_ENTRIES = int(os.getenv("SNAPSHOT_MAX_ENTRIES", "50000"))
+SNAPSHOT_CACHE_CONTROL = os.getenv("SNAPSHOT_CACHE_CONTROL", "no-cache")  # always revalidate; 304 is cheap
+
+# Popularity boost from confirmed orders (master_data.record_order): re-rank this many prefix hits
+POPULARITY_CANDIDATES = int(os.getenv("POPULARITY_CANDIDATES", "50"))
+POPULARITY_CUSTOMER_WEIGHT = float(os.getenv("POPULARITY_CUSTOMER_WEIGHT", "3"))  # own orders vs everyone's
+POPULARITY_TTL = float(os.getenv("POPULARITY_TTL", "60"))  # seconds before counters are re-read from Redis
+
+AUTOCOMPLETE_PAGE_SIZE = 10  # first page stays small; deeper pages only on demand (?cursor=)
+AUTOCOMPLETE_PAGE_MAX = int(os.getenv("AUTOCOMPLETE_PAGE_MAX", "50"))  # upper bound for ?limit=
 
-REDIS_HOST = "localhost"
-REDIS_PORT = 6379
-REDIS_DB = 0
+sync_lock = threading.Lock()
+memory_indexes = {}  # kind -> PrefixIndex, replaced wholesale on every rebuild
+ngram_indexes = {}   # kind -> TrigramIndex, same lifecycle
+index_versions = {}  # kind -> snapshot version the indexes were built from (reader processes only)
 
-r = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+# Hot-prefix answers ("a", "ce", "cem" ...); emptied whenever a reload or sync changes names
+autocomplete_cache = TTLCache(maxsize=AUTOCOMPLETE_CACHE_SIZE, ttl=AUTOCOMPLETE_CACHE_TTL)
+# kind -> "<generation>.<revision>" from Redis (ETag basis), shared by every worker and the async reader
+version_cache = TTLCache(maxsize=16, ttl=DATA_VERSION_TTL)
+local_versions = {}  # kind -> change counter, ETag basis only while Redis is unreachable (memory-only mode)
+# Compressed snapshot bodies by (kind, version, since, encoding); a version never changes content
+snapshot_cache = TTLCache(maxsize=64, ttl=3600)
+# (kind, customer code) -> (stamp, {code: score}); the stamp (popularity version) goes into ETags,
+# so they move on when an order changes the ranking and nowhere else
+popularity_cache = TTLCache(maxsize=1024, ttl=POPULARITY_TTL)
+
+
+def _names_changed(kind):
+    """Searchable names of `kind` changed: drop cached answers and move ETags on"""
+    autocomplete_cache.invalidate()
+    version_cache.invalidate(kind)
+    local_versions[kind] = local_versions.get(kind, 0) + 1
 
 
 # -----------------------------
 # INDEX CREATION
 # -----------------------------
-def create_customer_index():
-    """Create RediSearch index for customers if not exists"""
-    try:
-        r.execute_command(
-            "FT.CREATE", "idx:customers",
-            "ON", "HASH",
-            "PREFIX", "1", "customer:",
-            "SCHEMA",
-            "name", "TEXT", "PHONETIC", "dm:en"  # Define 'name' once with both TEXT and PHONETIC
-        )
-        print("✅ Created RediSearch index: idx:customers")
-    except redis.ResponseError as e:
-        if "Index already exists" in str(e):
-            print("ℹ️ Customer index already exists, skipping")
-        else:
-            raise
+def create_index(spec, generation):
+    """Create the RediSearch index for one generation of a master-data table"""
+    index_name = f"{spec['index']}:v{generation}"
+    r.execute_command(
+        "FT.CREATE", index_name,
+        "ON", "HASH",
+        "PREFIX", "1", generation_prefix(spec, generation),
+        "SCHEMA",
+        "name", "TEXT", "PHONETIC", "dm:en",  # Define 'name' once with both TEXT and PHONETIC
+        "name_key", "TAG"                      # normalized name, for exact resolution
+    )
+    print(f"✅ Created RediSearch index: {index_name}")
+    return index_name
 
 
-def create_item_index():
-    """Create RediSearch index for items if not exists"""
+def _drop_legacy_index(spec):
+    """Before aliases, the stable name was a real index; it has to go before the name can be an alias"""
     try:
-        r.execute_command(
-            "FT.CREATE", "idx:items",
-            "ON", "HASH",
-            "PREFIX", "1", "item:",
-            "SCHEMA",
-            "name", "TEXT", "PHONETIC", "dm:en"  # Define 'name' once with both TEXT and PHONETIC
-        )
-        print("✅ Created RediSearch index: idx:items")
-    except redis.ResponseError as e:
-        if "Index already exists" in str(e):
-            print("ℹ️ Item index already exists, skipping")
+        info = r.execute_command("FT.INFO", spec["index"])
+    except redis.ResponseError:
+        return  # neither an index nor an alias yet
+    info = dict(zip(info[::2], info[1::2]))
+    if info.get("index_name") == spec["index"]:
+        r.execute_command("FT.DROPINDEX", spec["index"])
+        print(f"ℹ️ Dropped pre-alias index {spec['index']}")
+
+
+def publish_generation(kind, generation, index_name):
+    """Atomically point the search alias at a fully loaded generation, then retire the old one"""
+    spec = MASTER_DATA[kind]
+    previous = current_generation(kind)
+
+    _drop_legacy_index(spec)
+    r.execute_command("FT.ALIASUPDATE", spec["index"], index_name)
+
+    pipe = r.pipeline(transaction=True)
+    pipe.set(f"{kind}:generation", generation)
+    # Snapshot versions restart with the generation; older clients get a full snapshot
+    pipe.set(f"{kind}:revision", 0)
+    pipe.delete(f"{kind}:changelog", f"{kind}:tombstones")  # tombstones: written by older versions, never read
+    for live_key in (f"{kind}:codes", spec["suggest"]):
+        if r.exists(f"{live_key}:v{generation}"):
+            pipe.rename(f"{live_key}:v{generation}", live_key)
         else:
-            raise
+            pipe.delete(live_key)  # empty table
+    pipe.execute()
+    print(f"✅ {spec['index']} now serves generation {generation}")
+
+    if previous and previous != str(generation):
+        try:
+            r.execute_command("FT.DROPINDEX", f"{spec['index']}:v{previous}")
+        except redis.ResponseError as e:
+            print(f"ℹ️ Could not drop {spec['index']}:v{previous}: {e}")
+    drop_stale_keys(spec, generation)
+
+
+def drop_stale_keys(spec, generation, batch_size=1000):
+    """UNLINK every key of this table outside the live generation, SCAN-ing in batches (never KEYS)"""
+    live_prefix = generation_prefix(spec, generation)
+    batch, dropped = [], 0
+    for key in r.scan_iter(match=f"{spec['key_prefix']}*", count=batch_size):
+        if key.startswith(live_prefix):
+            continue
+        batch.append(key)
+        if len(batch) >= batch_size:
+            r.unlink(*batch)
+            dropped += len(batch)
+            batch = []
+    if batch:
+        r.unlink(*batch)
+        dropped += len(batch)
+    if dropped:
+        print(f"🗑️ Unlinked {dropped} stale {spec['key_prefix']}* keys")
 
 
 # -----------------------------
 # LOAD DATA FROM HANA
 # -----------------------------
-def load_customers_into_redis():
-    """Load all customer names from SAP HANA into Redis"""
-    conn = dbapi.connect(
-        address=HANA_HOST,
-        port=HANA_PORT,
-        user=HANA_USER,
-        password=HANA_PASS
-    )
-    cursor = conn.cursor()
+def _rows_query(spec, since=None):
+    """Query for (code, name, UpdateDate, UpdateTS, *fields); only rows changed at/after `since` if given"""
+    extra_columns = "".join(f', T0."{column}"' for column in spec["fields"].values())
+    query = f'''
+    SELECT T0."{spec['code']}", T0."{spec['name']}", T0."UpdateDate", COALESCE(T0."UpdateTS", 0){extra_columns}
+    FROM "{HANA_SCHEMA}"."{spec['table']}" T0
+    '''
+    params = ()
+    if since:
+        # ">=" on the timestamp: rows written in the same second as the last sync are re-applied, never missed
+        query += '''
+    WHERE T0."UpdateDate" > ?
+       OR (T0."UpdateDate" = ? AND COALESCE(T0."UpdateTS", 0) >= ?)
+    '''
+        params = (since["date"], since["date"], int(since["ts"]))
+    return query, params
+
+
+def _stream_rows(query, params=(), batch_size=None):
+    """Yield HANA result rows in chunks (fetchmany) so the table never sits in memory at once"""
+    batch_size = batch_size or LOAD_BATCH_SIZE
+    with hana_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            while True:
+                chunk = cursor.fetchmany(batch_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            cursor.close()
+
+
+def _row_mapping(spec, row):
+    """Hash fields for one row: everything chat_v7 needs to resolve without HANA"""
+    mapping = {"code": row[0], "name": row[1] or "", "name_key": normalize_name(row[1])}
+    for field, value in zip(spec["fields"], row[4:]):
+        mapping[field] = "" if value is None else str(value)
+    return mapping
 
-    cursor.execute('SELECT "CardName" FROM "MJENGO_TEST_020725"."OCRD"')
-    customers = [row[0] for row in cursor.fetchall()]
-    conn.close()
 
-    # Clear old customer keys
-    old_keys = r.keys("customer:*")
-    if old_keys:
-        r.delete(*old_keys)
+def _write_chunk(spec, prefix, codes_key, suggest_key, chunk, replace=False, weights=None):
+    """One non-transactional pipeline per chunk: bounded client buffer, Redis never blocked for long.
 
-    # Insert customers as HASH
-    pipe = r.pipeline()
-    for i, v in enumerate(customers):
-        pipe.hset(f"customer:{i}", mapping={"name": v})
+    With `replace`, rows may already exist: renamed rows swap their suggestion entry,
+    unchanged names keep theirs (and whatever score it has built up).
+    New suggestion entries are weighted SUGGEST_WEIGHT + the code's order count from `weights`.
+    Returns the codes of rows that got a new or changed name.
+    """
+    weights = weights or {}
+    keys = [f"{prefix}{row[0]}" for row in chunk]
+    old_names = [None] * len(chunk)
+    if replace:
+        pipe = r.pipeline(transaction=False)
+        for key in keys:
+            pipe.hget(key, "name")
+        old_names = pipe.execute()
+
+    pipe = r.pipeline(transaction=False)
+    renamed = []
+    for key, row, old_name in zip(keys, chunk, old_names):
+        mapping = _row_mapping(spec, row)
+        pipe.hset(key, mapping=mapping)
+        if old_name == mapping["name"]:
+            continue
+        renamed.append(row[0])
+        if old_name:
+            pipe.execute_command("FT.SUGDEL", suggest_key, old_name)
+        if mapping["name"]:
+            weight = SUGGEST_WEIGHT + weights.get(row[0], 0)
+            pipe.execute_command("FT.SUGADD", suggest_key, mapping["name"], weight, "PAYLOAD", row[0])
+    pipe.sadd(codes_key, *[row[0] for row in chunk])
     pipe.execute()
+    return renamed
+
+
+def _suggest_weights(kind):
+    """code -> confirmed orders (most ordered POPULARITY_TOP codes), so popular names suggest first"""
+    try:
+        return popularity_scores(kind)
+    except redis.RedisError as e:
+        print(f"ℹ️ No popularity weights for {kind} suggestions: {e}")
+        return {}
+
+
+def _high_water_mark(rows, current=None):
+    """Latest (UpdateDate, UpdateTS) seen, as stored in the sync:<kind> hash"""
+    marks = [(str(row[2])[:10], int(row[3] or 0)) for row in rows if row[2] is not None]
+    if current and current.get("date"):
+        marks.append((current["date"], int(current["ts"])))
+    if not marks:
+        return None
+    date, ts = max(marks)
+    return {"date": date, "ts": ts}
+
+
+def _save_sync_state(kind, mark):
+    state = {"last_run": datetime.now().isoformat(timespec="seconds")}
+    if mark:
+        state.update(mark)
+    r.hset(f"sync:{kind}", mapping=state)
+
+
+def _report_load(message, count, started):
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else 0.0
+    line = f"{message}: {count} rows in {elapsed:.1f}s ({rate:,.0f} rows/sec"
+    if resource is not None:
+        # ru_maxrss is in KiB on Linux
+        line += f", peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB"
+    print(line + ")")
+
+
+def full_reload(kind):
+    """Re-select every row and rebuild the keys for one master-data table"""
+    spec = MASTER_DATA[kind]
+    started = time.perf_counter()
+
+    # Build into a fresh generation; searches keep using the old one until the alias moves
+    generation = r.incr(f"{kind}:generation:seq")
+    index_name = create_index(spec, generation)
+    prefix = generation_prefix(spec, generation)
+    codes_key = f"{kind}:codes:v{generation}"
+
+    # Insert rows as HASH and remember which codes exist (for tombstoning later)
+    count, mark = 0, None
+    names = [] if MEMORY_INDEX else None
+    weights = _suggest_weights(kind)
+    try:
+        for chunk in _stream_rows(*_rows_query(spec)):
+            _write_chunk(spec, prefix, codes_key, f"{spec['suggest']}:v{generation}", chunk, weights=weights)
+            count += len(chunk)
+            mark = _high_water_mark(chunk, current=mark)
+            if names is not None:
+                names.extend((row[0], row[1]) for row in chunk)
+    except Exception:
+        # Half-built generation is never published; its keys go with the next successful reload
+        r.execute_command("FT.DROPINDEX", index_name)
+        r.unlink(codes_key, f"{spec['suggest']}:v{generation}")
+        raise
+
+    publish_generation(kind, generation, index_name)
+    if names is not None:
+        _install_memory_indexes(kind, names)
+    _names_changed(kind)
+    _save_sync_state(kind, mark)
+    _report_load(f"✅ Loaded {kind} into Redis (generation {generation})", count, started)
+
+
+def incremental_sync(kind):
+    """Upsert rows changed since the stored high-water mark and remove rows deleted in SAP"""
+    spec = MASTER_DATA[kind]
+    since = r.hgetall(f"sync:{kind}")
+    generation = current_generation(kind)
+    if not generation:
+        # Nothing loaded yet → a full load is the only safe starting point
+        return full_reload(kind)
+    prefix = generation_prefix(spec, generation)
+    started = time.perf_counter()
+
+    # No high-water mark yet (e.g. the table was empty) → every row counts as changed
+    count, renamed, mark = 0, {}, since  # renamed: code -> new name (added or renamed rows)
+    weights = _suggest_weights(kind)
+    for chunk in _stream_rows(*_rows_query(spec, since=since if since.get("date") else None)):
+        changed = set(_write_chunk(spec, prefix, f"{kind}:codes", spec["suggest"], chunk, replace=True,
+                                   weights=weights))
+        renamed.update((row[0], row[1]) for row in chunk if row[0] in changed)
+        count += len(chunk)
+        mark = _high_water_mark(chunk, current=mark)
+
+    # Deleted rows: stream the live codes into a scratch set and let Redis compute the difference
+    live_key = f"{kind}:codes:live"
+    r.unlink(live_key)
+    code_query = f'''SELECT "{spec["code"]}" FROM "{HANA_SCHEMA}"."{spec["table"]}"'''
+    for chunk in _stream_rows(code_query):
+        r.sadd(live_key, *[row[0] for row in chunk])
+    deleted = list(r.sdiff(f"{kind}:codes", live_key))
+    r.unlink(live_key)
+
+    for i in range(0, len(deleted), LOAD_BATCH_SIZE):
+        batch = deleted[i:i + LOAD_BATCH_SIZE]
+        pipe = r.pipeline(transaction=False)
+        for code in batch:
+            pipe.hget(f"{prefix}{code}", "name")
+        names = pipe.execute()
+
+        pipe = r.pipeline(transaction=False)
+        for name in names:
+            if name:
+                pipe.execute_command("FT.SUGDEL", spec["suggest"], name)
+        pipe.unlink(*[f"{prefix}{code}" for code in batch])
+        pipe.srem(f"{kind}:codes", *batch)
+        pipe.execute()
+
+    _save_sync_state(kind, _high_water_mark([], current=mark))
+    _report_load(f"✅ Synced {kind} ({len(deleted)} deleted)", count, started)
+
+    if renamed or deleted:
+        # Deletions are only logged here: snapshot clients see a changed code with no name
+        _record_changes(kind, list(renamed) + deleted)
+        _names_changed(kind)
+    if MEMORY_INDEX:
+        if kind not in memory_indexes:
+            rebuild_memory_index(kind)
+        elif renamed or deleted:
+            patch_memory_index(kind, renamed, deleted)
+
+
+def _record_changes(kind, codes):
+    """Bump the snapshot revision and log which codes it touched (added, renamed or deleted)"""
+    revision = r.incr(f"{kind}:revision")
+    for i in range(0, len(codes), LOAD_BATCH_SIZE):
+        r.zadd(f"{kind}:changelog", {code: revision for code in codes[i:i + LOAD_BATCH_SIZE]})
+
+
+def rebuild_memory_index(kind):
+    """Build the in-process PrefixIndex for one table straight from HANA (no Redis involved)"""
+    spec = MASTER_DATA[kind]
+    started = time.perf_counter()
+    names = []
+    for chunk in _stream_rows(*_rows_query(spec)):
+        names.extend((row[0], row[1]) for row in chunk)
+    _install_memory_indexes(kind, names)
+    _report_load(f"✅ Built in-memory {kind} indexes", len(names), started)
+
 
-    print(f"✅ Loaded {len(customers)} customers into Redis.")
+def patch_memory_index(kind, renamed, deleted):
+    """New in-process indexes = the current one's names with this sync's changes applied (no HANA read).
+
+    renamed: {code: name} of added or renamed rows; deleted: codes removed in SAP.
+    """
+    started = time.perf_counter()
+    names = dict(memory_indexes[kind].records())
+    for code in deleted:
+        names.pop(code, None)
+    names.update(renamed)
+    _install_memory_indexes(kind, list(names.items()))
+    _report_load(f"✅ Patched in-memory {kind} indexes ({len(renamed)} changed, {len(deleted)} removed)",
+                 len(names), started)
+
+
+def _install_memory_indexes(kind, names):
+    """names: list of (code, name). Built first, then swapped in, so readers never see a partial index"""
+    prefix_index = PrefixIndex(names)
+    ngram_index = TrigramIndex(names)
+    memory_indexes[kind] = prefix_index
+    ngram_indexes[kind] = ngram_index
+    _names_changed(kind)
+
+
+def load_customers_into_redis():
+    """Load all customer names from SAP HANA into Redis"""
+    full_reload("customers")
 
 
 def load_items_into_redis():
     """Load all item names from SAP HANA into Redis"""
-    conn = dbapi.connect(
-        address=HANA_HOST,
-        port=HANA_PORT,
-        user=HANA_USER,
-        password=HANA_PASS
-    )
-    cursor = conn.cursor()
+    full_reload("items")
 
-    cursor.execute('SELECT "ItemName" FROM "MJENGO_TEST_020725"."OITM"')
-    items = [row[0] for row in cursor.fetchall()]
-    conn.close()
 
-    # Clear old item keys
-    old_keys = r.keys("item:*")
-    if old_keys:
-        r.delete(*old_keys)
+def load_master_data():
+    """Startup load; if Redis/RediSearch is unusable, still serve autocomplete from memory"""
+    for kind in MASTER_DATA:
+        try:
+            full_reload(kind)
+        except redis.RedisError as e:
+            if not MEMORY_INDEX:
+                raise
+            print(f"⚠️ Redis load of {kind} failed ({e}); serving it from the in-memory index")
+            rebuild_memory_index(kind)
 
-    # Insert items as HASH
-    pipe = r.pipeline()
-    for i, itm in enumerate(items):
-        pipe.hset(f"item:{i}", mapping={"name": itm})
-    pipe.execute()
 
-    print(f"✅ Loaded {len(items)} items into Redis.")
+def _sync_pass(mode):
+    for kind in MASTER_DATA:
+        if mode == "full":
+            full_reload(kind)
+        else:
+            incremental_sync(kind)
+
+
+def sync_master_data(mode="incremental"):
+    """Run one sync pass over every master-data table; serialized so passes never overlap"""
+    with sync_lock:
+        _sync_pass(mode)
+
+
+def start_sync(mode="incremental"):
+    """Run one sync pass in a background thread; False (nothing started) while another pass is running"""
+    if not sync_lock.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            _sync_pass(mode)
+        except Exception as e:
+            print(f"Master-data sync error ({mode}):", e)
+        finally:
+            sync_lock.release()
+
+    threading.Thread(target=run, name=f"master-data-sync-{mode}", daemon=True).start()
+    return True
+
+
+def follow_memory_indexes():
+    """Reader processes (they never load from HANA): build the in-process indexes from the snapshot
+    the loading process keeps in Redis, then apply only the changelog since the version they have"""
+    for kind in MASTER_DATA:
+        version = snapshot_version(kind)
+        if version is None or version == index_versions.get(kind):
+            continue
+        since = index_versions.get(kind) if kind in memory_indexes else None
+        snap = build_snapshot(kind, since=since, version=version)
+        if snap["full"]:
+            _install_memory_indexes(kind, list(zip(snap["codes"], snap["names"])))
+            print(f"✅ Built in-memory {kind} indexes from Redis ({len(snap['codes'])} names, version {version})")
+        else:
+            patch_memory_index(kind, dict(zip(snap["codes"], snap["names"])), snap["deleted"])
+        index_versions[kind] = version
+
+
+def start_index_follower():
+    """Run follow_memory_indexes every INDEX_FOLLOW_INTERVAL seconds in the background (0 disables it)"""
+    if INDEX_FOLLOW_INTERVAL <= 0:
+        return
+
+    def run():
+        while True:
+            time.sleep(INDEX_FOLLOW_INTERVAL)
+            try:
+                follow_memory_indexes()
+            except Exception as e:
+                print("In-memory index follow error:", e)
+
+    threading.Thread(target=run, name="memory-index-follower", daemon=True).start()
+
+
+def start_sync_scheduler():
+    """Run incremental syncs every SYNC_INTERVAL seconds in the background (0 disables it)"""
+    if SYNC_INTERVAL <= 0:
+        return
+
+    def run():
+        while True:
+            time.sleep(SYNC_INTERVAL)
+            try:
+                sync_master_data("incremental")
+            except Exception as e:
+                print("Master-data sync error:", e)
+
+    threading.Thread(target=run, name="master-data-sync", daemon=True).start()
+
+
+# -----------------------------
+# SNAPSHOTS
+# -----------------------------
+def snapshot_version(kind):
+    """"<generation>.<revision>" of the live names, or None before the first load"""
+    return names_version(kind)
+
+
+def _parse_version(version):
+    """"3.17" -> ("3", 17); None for anything malformed"""
+    generation, _, revision = (version or "").partition(".")
+    if not generation.isdigit() or not revision.isdigit():
+        return None
+    return generation, int(revision)
+
+
+def _names_of(prefix, codes):
+    """HGET name for many codes in one pipeline; None where the key is gone"""
+    pipe = r.pipeline(transaction=False)
+    for code in codes:
+        pipe.hget(f"{prefix}{code}", "name")
+    return pipe.execute()
+
+
+def build_snapshot(kind, since=None, version=None):
+    """Every (code, name) of the live generation, or only what changed after version `since`.
+
+    The version is read before the data, so the data is never older than its version:
+    a delta may repeat changes the client already has (upserts are idempotent) but never misses one.
+    A `since` from another generation (full reload in between) gets a full snapshot.
+    """
+    spec = MASTER_DATA[kind]
+    version = version or snapshot_version(kind)
+    generation, revision = _parse_version(version)
+    prefix = generation_prefix(spec, generation)
+    base = _parse_version(since)
+
+    if base and base[0] == generation and base[1] <= revision:
+        changed = r.zrangebyscore(f"{kind}:changelog", f"({base[1]}", "+inf")
+        codes, names, deleted = [], [], []
+        for i in range(0, len(changed), LOAD_BATCH_SIZE):
+            batch = changed[i:i + LOAD_BATCH_SIZE]
+            for code, name in zip(batch, _names_of(prefix, batch)):
+                if name is None:
+                    deleted.append(code)
+                else:
+                    codes.append(code)
+                    names.append(name)
+        return {"kind": kind, "version": version, "full": False,
+                "codes": codes, "names": names, "deleted": deleted}
+
+    codes, names, batch = [], [], []
+    for key in r.scan_iter(match=f"{prefix}*", count=LOAD_BATCH_SIZE):
+        batch.append(key[len(prefix):])
+        if len(batch) >= LOAD_BATCH_SIZE:
+            names += _names_of(prefix, batch)
+            codes += batch
+            batch = []
+    if batch:
+        names += _names_of(prefix, batch)
+        codes += batch
+    # A key unlinked between SCAN and HGET has no name; leave it out
+    pairs = [(code, name) for code, name in zip(codes, names) if name is not None]
+    return {"kind": kind, "version": version, "full": True,
+            "codes": [code for code, _ in pairs], "names": [name for _, name in pairs], "deleted": []}
+
+
+def encode_snapshot(payload, encoding):
+    """Compact JSON, compressed for the Content-Encoding the client accepts"""
+    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
 
 
 # -----------------------------
 # API ENDPOINTS
 # -----------------------------
-@app.route("/api/customers")
-def get_customers():
-    query = request.args.get("search", "").strip()
-    if not query:
-        return jsonify([])
+def fuzzy_search(kind, query, limit=10):
+    """Typo-tolerant ranked (code, name) pairs from the trigram index ([] when it is not built)"""
+    ngram_index = ngram_indexes.get(kind)
+    if ngram_index is None:
+        return []
+    return [(code, name) for _, name, code in ngram_index.search(query, limit, min_score=FUZZY_MIN_SCORE)]
+
+
+def popularity_reads(pipe, kind, customer=None):
+    """Queue popularity()'s reads on a pipeline (sync or redis.asyncio).
+
+    Version first: the scores read after it are never older than the stamp they are cached under.
+    """
+    pipe.get(popularity_version_key(kind))
+    pipe.zrevrange(popularity_key(kind), 0, POPULARITY_TOP - 1, withscores=True)
+    if customer:
+        pipe.zrevrange(popularity_key(kind, customer), 0, POPULARITY_TOP - 1, withscores=True)
+    return pipe
+
+
+def cache_popularity(kind, customer, results):
+    """(stamp, {code: score}) from the popularity_reads() results, cached for POPULARITY_TTL"""
+    stamp, counts, *customer_counts = results
+    scores = dict(counts)
+    for code, count in (customer_counts[0] if customer_counts else []):
+        scores[code] = scores.get(code, 0) + POPULARITY_CUSTOMER_WEIGHT * count
+
+    cached = (stamp or "0", scores)
+    popularity_cache.set((kind, customer or ""), cached)
+    return cached
+
+
+def popularity(kind, customer=None):
+    """(stamp, {code: score}): global order counts plus the customer's own, weighted up.
+
+    Read from Redis at most every POPULARITY_TTL seconds; empty when Redis is down.
+    """
+    cached = popularity_cache.get((kind, customer or ""))
+    if cached is not None:
+        return cached
+
+    try:
+        results = popularity_reads(r.pipeline(transaction=False), kind, customer).execute()
+    except redis.RedisError:
+        return "0", {}
+    return cache_popularity(kind, customer, results)
+
+
+def window_key(kind, query, backend):
+    """autocomplete_cache key of the popularity window of `query`"""
+    return (MASTER_DATA[kind]["index"], normalize_name(query), POPULARITY_CANDIDATES, backend)
 
+
+def cache_window(kind, query, backend, entries):
+    """Cache the first POPULARITY_CANDIDATES prefix matches as (entries, fuzzy).
+
+    A typo in the first letters defeats every prefix search: with no `entries`, the window is
+    ranked by trigram similarity instead.
+    """
+    fuzzy = not entries
+    if fuzzy:
+        entries = fuzzy_search(kind, query, POPULARITY_CANDIDATES)
+    window = (entries, fuzzy)
+    autocomplete_cache.set(window_key(kind, query, backend), window)
+    return window
+
+
+def rank_by_popularity(entries, scores):
+    """Most ordered (code, name) entries first; stable, so ties keep their relevance order"""
+    if not scores:
+        return entries
+    return sorted(entries, key=lambda entry: -scores.get(entry[0], 0))
+
+
+def window_page(window, scores, offset, limit):
+    """Rank the window by popularity and cut a page out of it.
+
+    (entries, (start, count) still needed beyond the window or None, more)
+    """
+    entries = rank_by_popularity(window[0], scores)
+    end = offset + limit
+    page = entries[offset:end]
+    if len(entries) < POPULARITY_CANDIDATES:
+        # The window holds every match there is
+        return page, None, end < len(entries)
+    if end <= len(entries):
+        return page, None, True
+    start = max(offset, len(entries))
+    return page, (start, end - start), None
+
+
+def beyond_backend(window, backend):
+    """Backend for pages past the window: the one that filled it"""
+    return "ngram" if window[1] else backend
+
+
+def search_page(kind, query, offset=0, limit=AUTOCOMPLETE_PAGE_SIZE, backend=None, customer=None):
+    """Names [offset:offset + limit] of the ranked result list, and whether more may follow.
+
+    Pages inside the popularity window come from the cached window; deeper pages
+    ask the backend for exactly that slice, in its own relevance order.
+    """
+    backend = backend or AUTOCOMPLETE_BACKEND
+    window = autocomplete_cache.get(window_key(kind, query, backend))
+    if window is None:
+        window = cache_window(kind, query, backend, _prefix_search(kind, query, POPULARITY_CANDIDATES, backend))
+
+    _, scores = popularity(kind, customer)
+    page, beyond, more = window_page(window, scores, offset, limit)
+    if beyond:
+        start, wanted = beyond
+        extra = _prefix_search(kind, query, wanted + 1, beyond_backend(window, backend), offset=start)
+        page, more = page + extra[:wanted], len(extra) > wanted
+    return [name for _, name in page], more
+
+
+def search_names(kind, query, limit=10, backend=None, customer=None):
+    """Prefix search on the chosen backend, typo-tolerant search when the prefix finds nothing"""
+    return search_page(kind, query, 0, limit, backend, customer)[0]
+
+
+def memory_search(kind, query, limit, offset=0):
+    """(code, name) pairs [offset:offset + limit] from the in-memory prefix index; None when it is not built"""
+    memory_index = memory_indexes.get(kind)
+    if memory_index is None:
+        return None
+    return memory_index.search(query, offset + limit, with_codes=True)[offset:]
+
+
+def local_search(kind, query, limit, backend, offset=0):
+    """The ngram and memory backends, which need no Redis round trip; None means ask RediSearch"""
+    if backend == "ngram":
+        return fuzzy_search(kind, query, offset + limit)[offset:]
+    if backend == "memory":
+        return memory_search(kind, query, limit, offset)
+    return None
+
+
+def prefix_command(kind, query, limit, offset=0):
+    """FT.SEARCH arguments for (code, name) of the names starting with `query`"""
     # Use * for prefix search
-    redis_query = f"{query}*"
+    return ("FT.SEARCH", MASTER_DATA[kind]["index"], f"{query}*",
+            "RETURN", "2", "code", "name",
+            "LIMIT", str(offset), str(limit))
+
+
+def prefix_entries(res):
+    """(code, name) pairs of an FT.SEARCH reply"""
+    return [(doc.get("code"), doc["name"]) for doc in parse_search_results(res) if "name" in doc]
+
+
+def _prefix_search(kind, query, limit, backend, offset=0):
+    """(code, name) pairs [offset:offset + limit]; RediSearch falls back to the in-memory prefix index when it fails"""
+    entries = local_search(kind, query, limit, backend, offset)
+    if entries is not None:
+        return entries
 
     try:
-        res = r.execute_command(
-            "FT.SEARCH", "idx:customers", redis_query,
-            "RETURN", "1", "name",
-            "LIMIT", "0", "10"
-        )
-    except redis.ResponseError as e:
+        res = r.execute_command(*prefix_command(kind, query, limit, offset))
+    except (redis.ResponseError, redis.ConnectionError):
+        # RediSearch missing, index not built yet or Redis down
+        entries = memory_search(kind, query, limit, offset)
+        if entries is None:
+            raise
+        return entries
+
+    return prefix_entries(res)
+
+
+def local_version(kind):
+    """ETag version while Redis is down: this process's own change counter"""
+    return f"local.{local_versions.get(kind, 0)}"
+
+
+def data_version(kind):
+    """snapshot_version(kind), cached for DATA_VERSION_TTL; the same in every process for the same data"""
+    version = version_cache.get(kind)
+    if version is None:
+        try:
+            version = snapshot_version(kind) or "0"
+        except redis.RedisError:
+            version = local_version(kind)
+        version_cache.set(kind, version)
+    return version
+
+
+def etag_for(kind, etag_parts, version=None):
+    """Data version of `kind` + digest of the query parts"""
+    digest = hashlib.sha1("|".join(map(str, etag_parts)).encode()).hexdigest()[:16]
+    return f"{version or data_version(kind)}-{digest}"
+
+
+def cache_headers(response, etag, cache_control):
+    """Weak ETag + Cache-Control on a Flask or Quart response"""
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def conditional_json(kind, etag_parts, produce):
+    """jsonify(produce()) with an ETag from the data version + query.
+
+    A matching If-None-Match gets a 304 without running produce() at all.
+    """
+    etag = etag_for(kind, etag_parts)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(produce())
+    return cache_headers(response, etag, AUTOCOMPLETE_CACHE_CONTROL)
+
+
+def encode_cursor(query, offset, limit):
+    """Opaque continuation token: where the next page of this query starts"""
+    raw = json.dumps({"q": normalize_name(query), "o": offset, "n": limit}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, query):
+    """(offset, limit) from a token; ValueError if it is malformed or belongs to another query"""
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        offset, limit = int(cursor["o"]), int(cursor["n"])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+    if cursor.get("q") != normalize_name(query):
+        raise ValueError("Cursor belongs to another search")
+    if offset < 0 or not 0 < limit <= AUTOCOMPLETE_PAGE_MAX:
+        raise ValueError("Invalid cursor")
+    return offset, limit
+
+
+def parse_autocomplete(args, paged):
+    """Autocomplete parameters (search, cursor, limit, backend, customer) from a query string or a
+    WebSocket message. ValueError on a bad cursor or limit.
+    """
+    query = str(args.get("search") or "").strip()
+    offset, limit = 0, AUTOCOMPLETE_PAGE_SIZE
+    token = args.get("cursor") or ""
+    if query and token:
+        offset, limit = decode_cursor(token, query)
+    elif paged and args.get("limit"):
+        limit = max(1, min(int(args["limit"]), AUTOCOMPLETE_PAGE_MAX))
+    return {
+        "query": query, "offset": offset, "limit": limit, "paged": paged,
+        "backend": args.get("backend") or AUTOCOMPLETE_BACKEND,
+        "customer": str(args.get("customer") or "").strip() or None,  # CardCode: boost what they order
+    }
+
+
+def autocomplete_etag(params, stamp):
+    """ETag parts of an autocomplete query; `stamp` is its popularity stamp, which changes the ranking"""
+    return ("search", params["backend"], normalize_name(params["query"]), params["offset"],
+            params["limit"], params["paged"], params["customer"], stamp)
+
+
+def autocomplete_payload(kind, params):
+    """Plain list of names, or for paged requests {"results": [...], "next_cursor": token or null}"""
+    query, offset, limit = params["query"], params["offset"], params["limit"]
+    names, more = [], False
+    if query:
+        names, more = search_page(kind, query, offset, limit,
+                                  backend=params["backend"], customer=params["customer"])
+    if not params["paged"]:
+        return names
+    return {"results": names, "next_cursor": encode_cursor(query, offset + limit, limit) if more else None}
+
+
+def _autocomplete(kind):
+    """Plain list of names; with a ?cursor= parameter (empty for the first page) a page object"""
+    try:
+        params = parse_autocomplete(request.args, paged="cursor" in request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not params["query"]:
+        return jsonify(autocomplete_payload(kind, params))
+
+    try:
+        stamp, _ = popularity(kind, params["customer"])
+        return conditional_json(kind, autocomplete_etag(params, stamp), lambda: autocomplete_payload(kind, params))
+    except redis.RedisError as e:
         return jsonify({"error": str(e)}), 500
 
-    customer_names = []
-    for i in range(1, len(res), 2):
-        fields = res[i + 1]
-        for j in range(0, len(fields), 2):
-            if fields[j] == "name":
-                customer_names.append(fields[j + 1])
 
-    return jsonify(customer_names)
+@app.route("/api/customers")
+def get_customers():
+    return _autocomplete("customers")
 
 
 @app.route("/api/items")
 def get_items():
-    query = request.args.get("search", "").strip()
+    return _autocomplete("items")
+
+
+def parse_suggest(kind, args):
+    """(FT.SUGGET command, ETag parts without the popularity stamp) for ?search=&fuzzy=&max=.
+
+    None for an empty search; ValueError on a bad max.
+    """
+    query = args.get("search", "").strip()
     if not query:
+        return None
+
+    try:
+        limit = min(int(args.get("max", "10")), SUGGEST_MAX)
+    except ValueError:
+        raise ValueError("'max' must be a number")
+
+    fuzzy = args.get("fuzzy", "").lower() in ("1", "true", "yes")
+    command = ["FT.SUGGET", MASTER_DATA[kind]["suggest"], query]
+    if fuzzy:
+        command.append("FUZZY")  # prefixes within Levenshtein distance 1
+    command += ["MAX", str(limit)]
+    return command, ("suggest", query, fuzzy, limit)
+
+
+@app.route("/api/suggest/<kind>")
+def suggest(kind):
+    """Keystroke autocomplete from the FT.SUGADD dictionary: ?search=<prefix>&fuzzy=1&max=10"""
+    if kind not in MASTER_DATA:
+        return jsonify({"error": f"Unknown master data: {kind}"}), 404
+
+    try:
+        parsed = parse_suggest(kind, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if parsed is None:
         return jsonify([])
-    
-    # Use * for prefix search
-    redis_query = f"{query}*"
+    command, etag_parts = parsed
+
+    try:
+        # Confirmed orders re-weight entries (FT.SUGADD INCR), so the popularity stamp is part of the ETag
+        stamp, _ = popularity(kind)
+        return conditional_json(kind, (*etag_parts, stamp), lambda: r.execute_command(*command) or [])
+    except redis.RedisError as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/<kind>/resolve")
+def resolve_name(kind):
+    """Exact name -> stored fields (code, name, price_unit, ...), or 404"""
+    if kind not in MASTER_DATA:
+        return jsonify({"error": f"Unknown master data: {kind}"}), 404
+
+    name = request.args.get("name", "").strip()
+    if not name:
+        return jsonify({"error": "Missing 'name'"}), 400
+
+    try:
+        doc = resolve(kind, name)
+    except redis.RedisError as e:
+        return jsonify({"error": str(e)}), 500
+
+    if not doc:
+        return jsonify({"error": f"{name} not found"}), 404
+    doc.pop("name_key", None)
+    return jsonify(doc)
+
+
+def parse_since(args):
+    """?since=<version> of a snapshot request; "" (full snapshot) for an unknown or malformed base"""
+    since = args.get("since", "")
+    return since if _parse_version(since) else ""
+
+
+def snapshot_encoding(accept_encodings):
+    """Best Content-Encoding the client accepts: br (when brotli is installed), gzip or identity"""
+    if brotli is not None and "br" in accept_encodings:
+        return "br"
+    if "gzip" in accept_encodings:
+        return "gzip"
+    return "identity"
+
+
+def snapshot_refusal(kind, count, version):
+    """(error payload, status) when no snapshot can be served, else None"""
+    if count > SNAPSHOT_MAX_ENTRIES:
+        return {"error": "Snapshot too large", "count": count, "max": SNAPSHOT_MAX_ENTRIES}, 413
+    if version is None:
+        return {"error": f"{kind} not loaded yet"}, 503
+    return None
+
+
+def snapshot_etag(kind, version, since):
+    """Weak ETag of a full snapshot or of the changes since `since`"""
+    return f"{kind}-{version}-{since or 'full'}"
+
+
+def snapshot_body(kind, version, since, encoding):
+    """Encoded snapshot bytes, cached per (kind, version, since, encoding)"""
+    cache_key = (kind, version, since, encoding)
+    body = snapshot_cache.get(cache_key)
+    if body is None:
+        body = encode_snapshot(build_snapshot(kind, since, version), encoding)
+        snapshot_cache.set(cache_key, body)
+    return body
+
 
+def snapshot_headers(response, etag, encoding):
+    """Content-Encoding, Vary and cache headers of a snapshot response (200 or 304)"""
+    if encoding != "identity" and response.status_code == 200:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    return cache_headers(response, etag, SNAPSHOT_CACHE_CONTROL)
+
+
+@app.route("/api/snapshot/<kind>")
+def snapshot(kind):
+    """All names with their codes for client-side filtering: ?since=<version> returns only the changes.
+
+    413 when the table is over SNAPSHOT_MAX_ENTRIES; clients then stay on /api/<kind>.
+    """
+    if kind not in MASTER_DATA:
+        return jsonify({"error": f"Unknown master data: {kind}"}), 404
+
+    since, encoding = parse_since(request.args), snapshot_encoding(request.accept_encodings)
     try:
-        res = r.execute_command(
-            "FT.SEARCH", "idx:items", redis_query,
-            "RETURN", "1", "name",
-            "LIMIT", "0", "10"
-        )
-    except redis.ResponseError as e:
+        count, version = r.scard(f"{kind}:codes"), snapshot_version(kind)
+        refusal = snapshot_refusal(kind, count, version)
+        if refusal is not None:
+            return jsonify(refusal[0]), refusal[1]
+
+        etag = snapshot_etag(kind, version, since)
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(snapshot_body(kind, version, since, encoding), mimetype="application/json")
+    except redis.RedisError as e:
         return jsonify({"error": str(e)}), 500
 
-    item_names = []
-    for i in range(1, len(res), 2):
-        fields = res[i + 1]
-        for j in range(0, len(fields), 2):
-            if fields[j] == "name":
-                item_names.append(fields[j + 1])
+    return snapshot_headers(response, etag, encoding)
+
+
+@app.route("/api/popular/<kind>")
+def popular(kind):
+    """Most ordered codes with their scores (?customer=<CardCode> adds that customer's own orders).
+
+    Lets clients that filter a snapshot locally rank it the same way as /api/<kind>.
+    """
+    if kind not in MASTER_DATA:
+        return jsonify({"error": f"Unknown master data: {kind}"}), 404
+
+    customer = request.args.get("customer", "").strip() or None
+    stamp, scores = popularity(kind, customer)
+    return conditional_json(kind, ("popular", customer, stamp), lambda: scores)
+
+
+def _latest_message(ws, message):
+    """`message`, or the newest one already queued behind it; superseded keystrokes are skipped"""
+    while True:
+        newer = ws.receive(timeout=0)
+        if newer is None:
+            return message
+        message = newer
+
+
+def autocomplete_socket(ws):
+    """One persistent autocomplete channel per tab, instead of an HTTP request per keystroke.
+
+    Client -> server: {"seq": n, "kind": "items", "search": "cem", "cursor": "", "customer": ...}
+    Server -> client: {"seq": n, "results": [...], "next_cursor": ...} or {"seq": n, "error": ...}
+    Only the newest query is answered: messages queued behind a newer one are dropped unread,
+    and a result is thrown away if a newer query arrived while it was being computed.
+    """
+    message = ws.receive()
+    while message is not None:
+        message = _latest_message(ws, message)
+        seq = None
+        try:
+            query = json.loads(message)
+            if not isinstance(query, dict):
+                raise ValueError("Expected a JSON object")
+            seq, kind = query.get("seq"), query.get("kind")
+            if kind not in MASTER_DATA:
+                raise ValueError(f"Unknown master data: {kind}")
+            reply = autocomplete_payload(kind, parse_autocomplete(query, paged=True))
+        except (ValueError, TypeError, redis.RedisError) as e:
+            reply = {"error": str(e)}
 
-    return jsonify(item_names)
+        newer = ws.receive(timeout=0)
+        if newer is not None:
+            message = newer  # already stale: answer the newer query instead
+            continue
+        reply["seq"] = seq
+        ws.send(json.dumps(reply, separators=(",", ":"), ensure_ascii=False))
+        message = ws.receive()
+
+
+if sock is not None:
+    sock.route("/ws/autocomplete")(autocomplete_socket)
+
+
+@app.route("/api/cache/stats")
+def autocomplete_cache_stats():
+    """Hit ratio of the hot-prefix cache in front of /api/customers and /api/items"""
+    return jsonify(autocomplete_cache.stats())
+
+
+def sync_refusal(args, headers, remote_addr):
+    """(error payload, status) when this POST /api/sync may not start a pass, else None.
+
+    A full reload takes minutes and every page may call us (CORS), so only holders of
+    SYNC_TOKEN, or local callers when no token is configured, can trigger one.
+    """
+    mode = args.get("mode", "incremental")
+    if mode not in ("incremental", "full"):
+        return {"error": f"Unknown sync mode: {mode}"}, 400
+    if SYNC_TOKEN:
+        if not hmac.compare_digest(headers.get("X-Sync-Token", ""), SYNC_TOKEN):
+            return {"error": "Invalid or missing X-Sync-Token"}, 403
+    elif remote_addr not in ("127.0.0.1", "::1"):
+        return {"error": "Sync can only be triggered locally (set SYNC_TOKEN to allow remote calls)"}, 403
+    return None
+
+
+def sync_status():
+    """Whether a pass is running, plus the stored high-water mark of every table"""
+    return {"running": sync_lock.locked(), **{kind: r.hgetall(f"sync:{kind}") for kind in MASTER_DATA}}
+
+
+@app.route("/api/sync", methods=["GET", "POST"])
+def trigger_sync():
+    """POST starts a sync pass in the background (?mode=incremental, the default, or ?mode=full)
+    and answers 202 at once, 409 while one is running; GET reports progress.
+    """
+    try:
+        if request.method == "GET":
+            return jsonify(sync_status())
+
+        refusal = sync_refusal(request.args, request.headers, request.remote_addr)
+        if refusal is not None:
+            return jsonify(refusal[0]), refusal[1]
+        if not start_sync(request.args.get("mode", "incremental")):
+            return jsonify({"error": "A sync is already running", **sync_status()}), 409
+        return jsonify(sync_status()), 202
+    except redis.RedisError as e:
+        return jsonify({"error": str(e)}), 500
 
 
 # -----------------------------
 # MAIN
 # -----------------------------
 if __name__ == "__main__":
-    create_customer_index()
-    create_item_index()
-    load_customers_into_redis()
-    load_items_into_redis()
+    load_master_data()
+    start_sync_scheduler()
     app.run(host="0.0.0.0", port=5000, debug=False)
@@ -0,0 +1,351 @@
+from quart import Quart, request, websocket, jsonify
+from dotenv import load_dotenv
+from master_data import (
+    MASTER_DATA, REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_CONNECT_TIMEOUT, resolve, format_version, version_keys
+)
+import redis_store as rs
+import redis.asyncio as aioredis
+import asyncio
+import redis
+import json
+import os
+
+load_dotenv()
+
+# Async serving mode: every endpoint of redis_store.py on asyncio + redis.asyncio, so an in-flight
+# FT.SEARCH holds a coroutine instead of a worker thread. This module only awaits the Redis round
+# trips; request parsing, ranking, ETags, encoding negotiation and the caches are the pure helpers
+# of redis_store.py. Loading, syncing, snapshot bodies and /resolve run the redis_store.py
+# functions in a worker thread (asyncio.to_thread).
+#
+#   python redis_store_async.py                            # replaces `python redis_store.py`
+#   ASYNC_LOAD_MASTER_DATA=0 hypercorn redis_store_async:app  # reader: another process loads and syncs
+#
+# A reader builds its in-memory Prefix/Trigram indexes from the names in Redis and follows the
+# snapshot changelog (redis_store.follow_memory_indexes); ETags use the Redis version either way.
+app = Quart(__name__)
+
+# --- CONFIG ---
+ASYNC_PORT = int(os.getenv("ASYNC_PORT", "5000"))
+ASYNC_REDIS_MAX_CONNECTIONS = int(os.getenv("ASYNC_REDIS_MAX_CONNECTIONS", "200"))  # shared by all requests
+ASYNC_REDIS_POOL_TIMEOUT = float(os.getenv("ASYNC_REDIS_POOL_TIMEOUT", "5"))  # seconds to wait for a connection
+ASYNC_LOAD_MASTER_DATA = os.getenv("ASYNC_LOAD_MASTER_DATA", "1") == "1"  # also run the startup load + sync
+
+ar = None  # redis.asyncio client over one BlockingConnectionPool; created when serving starts
+
+
+@app.before_serving
+async def startup():
+    global ar
+    # Blocking pool: past max_connections, requests wait for a free connection instead of opening more
+    pool = aioredis.BlockingConnectionPool(
+        host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        max_connections=ASYNC_REDIS_MAX_CONNECTIONS, timeout=ASYNC_REDIS_POOL_TIMEOUT
+    )
+    ar = aioredis.Redis(connection_pool=pool)
+
+    if ASYNC_LOAD_MASTER_DATA:
+        # HANA/Redis loading is blocking; keep it off the event loop
+        await asyncio.to_thread(rs.load_master_data)
+        rs.start_sync_scheduler()
+    elif rs.MEMORY_INDEX:
+        # Reader: no HANA access; typo-tolerant fallback and ?backend=memory use what the loader wrote
+        await asyncio.to_thread(rs.follow_memory_indexes)
+        rs.start_index_follower()
+
+
+@app.after_serving
+async def shutdown():
+    await ar.aclose()
+
+
+@app.after_request
+async def allow_cors(response):
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
+# -----------------------------
+# SEARCH
+# -----------------------------
+# Same results and caches as redis_store.search_page; only the Redis round trips are awaited.
+# The in-memory Prefix/Trigram indexes need no I/O and are called directly.
+async def popularity(kind, customer=None):
+    """Async redis_store.popularity: (stamp, {code: score}), sharing its cache"""
+    cached = rs.popularity_cache.get((kind, customer or ""))
+    if cached is not None:
+        return cached
+
+    try:
+        results = await rs.popularity_reads(ar.pipeline(transaction=False), kind, customer).execute()
+    except redis.RedisError:
+        return "0", {}
+    return rs.cache_popularity(kind, customer, results)
+
+
+async def prefix_search(kind, query, limit, backend, offset=0):
+    """Async redis_store._prefix_search"""
+    entries = rs.local_search(kind, query, limit, backend, offset)
+    if entries is not None:
+        return entries
+
+    try:
+        res = await ar.execute_command(*rs.prefix_command(kind, query, limit, offset))
+    except (redis.ResponseError, redis.ConnectionError):
+        entries = rs.memory_search(kind, query, limit, offset)
+        if entries is None:
+            raise
+        return entries
+
+    return rs.prefix_entries(res)
+
+
+async def search_page(kind, query, offset, limit, backend, customer):
+    """Async redis_store.search_page: (names, more)"""
+    window = rs.autocomplete_cache.get(rs.window_key(kind, query, backend))
+    if window is None:
+        entries = await prefix_search(kind, query, rs.POPULARITY_CANDIDATES, backend)
+        window = rs.cache_window(kind, query, backend, entries)
+
+    _, scores = await popularity(kind, customer)
+    page, beyond, more = rs.window_page(window, scores, offset, limit)
+    if beyond:
+        start, wanted = beyond
+        extra = await prefix_search(kind, query, wanted + 1, rs.beyond_backend(window, backend), offset=start)
+        page, more = page + extra[:wanted], len(extra) > wanted
+    return [name for _, name in page], more
+
+
+# -----------------------------
+# API ENDPOINTS
+# -----------------------------
+async def data_version(kind):
+    """Async redis_store.data_version: same versions and cache, so ETags match the sync server"""
+    version = rs.version_cache.get(kind)
+    if version is None:
+        try:
+            version = format_version(*await ar.mget(*version_keys(kind))) or "0"
+        except redis.RedisError:
+            version = rs.local_version(kind)
+        rs.version_cache.set(kind, version)
+    return version
+
+
+async def conditional_json(kind, etag_parts, produce):
+    """Async redis_store.conditional_json: `produce` is a coroutine function"""
+    etag = rs.etag_for(kind, etag_parts, version=await data_version(kind))
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class("", status=304)
+    else:
+        response = jsonify(await produce())
+    return rs.cache_headers(response, etag, rs.AUTOCOMPLETE_CACHE_CONTROL)
+
+
+async def autocomplete_payload(kind, params):
+    """Async redis_store.autocomplete_payload"""
+    query, offset, limit = params["query"], params["offset"], params["limit"]
+    names, more = [], False
+    if query:
+        names, more = await search_page(kind, query, offset, limit, params["backend"], params["customer"])
+    if not params["paged"]:
+        return names
+    return {"results": names, "next_cursor": rs.encode_cursor(query, offset + limit, limit) if more else None}
+
+
+async def _autocomplete(kind):
+    try:
+        params = rs.parse_autocomplete(request.args, paged="cursor" in request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not params["query"]:
+        return jsonify(await autocomplete_payload(kind, params))
+
+    async def produce():
+        return await autocomplete_payload(kind, params)
+
+    try:
+        stamp, _ = await popularity(kind, params["customer"])
+        return await conditional_json(kind, rs.autocomplete_etag(params, stamp), produce)
+    except redis.RedisError as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/customers")
+async def get_customers():
+    return await _autocomplete("customers")
+
+
+@app.route("/api/items")
+async def get_items():
+    return await _autocomplete("items")
+
+
+@app.route("/api/suggest/<kind>")
+async def suggest(kind):
+    """Keystroke autocomplete from the FT.SUGADD dictionary: ?search=<prefix>&fuzzy=1&max=10"""
+    if kind not in MASTER_DATA:
+        return jsonify({"error": f"Unknown master data: {kind}"}), 404
+
+    try:
+        parsed = rs.parse_suggest(kind, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if parsed is None:
+        return jsonify([])
+    command, etag_parts = parsed
+
+    async def produce():
+        return await ar.execute_command(*command) or []
+
+    try:
+        stamp, _ = await popularity(kind)
+        return await conditional_json(kind, (*etag_parts, stamp), produce)
+    except redis.RedisError as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/popular/<kind>")
+async def popular(kind):
+    """Most ordered codes with their scores (?customer=<CardCode> adds that customer's own orders)"""
+    if kind not in MASTER_DATA:
+        return jsonify({"error": f"Unknown master data: {kind}"}), 404
+
+    customer = request.args.get("customer", "").strip() or None
+    stamp, scores = await popularity(kind, customer)
+
+    async def produce():
+        return scores
+
+    return await conditional_json(kind, ("popular", customer, stamp), produce)
+
+
+@app.route("/api/<kind>/resolve")
+async def resolve_name(kind):
+    """Exact name -> stored fields (code, name, price_unit, ...), or 404"""
+    if kind not in MASTER_DATA:
+        return jsonify({"error": f"Unknown master data: {kind}"}), 404
+
+    name = request.args.get("name", "").strip()
+    if not name:
+        return jsonify({"error": "Missing 'name'"}), 400
+
+    try:
+        doc = await asyncio.to_thread(resolve, kind, name)
+    except redis.RedisError as e:
+        return jsonify({"error": str(e)}), 500
+
+    if not doc:
+        return jsonify({"error": f"{name} not found"}), 404
+    doc.pop("name_key", None)
+    return jsonify(doc)
+
+
+@app.route("/api/snapshot/<kind>")
+async def snapshot(kind):
+    """Async redis_store.snapshot: same versions, ETags and cached bodies"""
+    if kind not in MASTER_DATA:
+        return jsonify({"error": f"Unknown master data: {kind}"}), 404
+
+    since, encoding = rs.parse_since(request.args), rs.snapshot_encoding(request.accept_encodings)
+    try:
+        pipe = ar.pipeline(transaction=False)
+        pipe.scard(f"{kind}:codes")
+        pipe.mget(*version_keys(kind))
+        count, (generation, revision) = await pipe.execute()
+        version = format_version(generation, revision)
+        refusal = rs.snapshot_refusal(kind, count, version)
+        if refusal is not None:
+            return jsonify(refusal[0]), refusal[1]
+
+        etag = rs.snapshot_etag(kind, version, since)
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class("", status=304)
+        else:
+            # Cache miss: many pipelined reads plus compression, so off the event loop
+            body = rs.snapshot_cache.get((kind, version, since, encoding))
+            if body is None:
+                body = await asyncio.to_thread(rs.snapshot_body, kind, version, since, encoding)
+            response = app.response_class(body, mimetype="application/json")
+    except redis.RedisError as e:
+        return jsonify({"error": str(e)}), 500
+
+    return rs.snapshot_headers(response, etag, encoding)
+
+
+@app.websocket("/ws/autocomplete")
+async def autocomplete_socket():
+    """Async redis_store.autocomplete_socket: same protocol, only the newest query is answered.
+
+    A reader task keeps just the latest message; a query still running when a newer one
+    arrives is not sent, the loop moves on to the newer one.
+    """
+    latest = [None]
+    arrived = asyncio.Event()
+
+    async def read():
+        while True:
+            latest[0] = await websocket.receive()
+            arrived.set()
+
+    reader = asyncio.ensure_future(read())
+    try:
+        while True:
+            await arrived.wait()
+            arrived.clear()
+            seq = None
+            try:
+                query = json.loads(latest[0])
+                if not isinstance(query, dict):
+                    raise ValueError("Expected a JSON object")
+                seq, kind = query.get("seq"), query.get("kind")
+                if kind not in MASTER_DATA:
+                    raise ValueError(f"Unknown master data: {kind}")
+                reply = await autocomplete_payload(kind, rs.parse_autocomplete(query, paged=True))
+            except (ValueError, TypeError, redis.RedisError) as e:
+                reply = {"error": str(e)}
+
+            if arrived.is_set():
+                continue  # already stale: answer the newer query instead
+            reply["seq"] = seq
+            await websocket.send(json.dumps(reply, separators=(",", ":"), ensure_ascii=False))
+    finally:
+        reader.cancel()
+
+
+@app.route("/api/cache/stats")
+async def autocomplete_cache_stats():
+    """Hit ratio of the hot-prefix cache in front of /api/customers and /api/items"""
+    return jsonify(rs.autocomplete_cache.stats())
+
+
+async def sync_status():
+    """Async redis_store.sync_status"""
+    pipe = ar.pipeline(transaction=False)
+    for kind in MASTER_DATA:
+        pipe.hgetall(f"sync:{kind}")
+    return {"running": rs.sync_lock.locked(), **dict(zip(MASTER_DATA, await pipe.execute()))}
+
+
+@app.route("/api/sync", methods=["GET", "POST"])
+async def trigger_sync():
+    """Async redis_store.trigger_sync: POST starts a background pass (202, 409 while one runs), GET reports"""
+    try:
+        if request.method == "GET":
+            return jsonify(await sync_status())
+
+        refusal = rs.sync_refusal(request.args, request.headers, request.remote_addr)
+        if refusal is not None:
+            return jsonify(refusal[0]), refusal[1]
+        if not rs.start_sync(request.args.get("mode", "incremental")):
+            return jsonify({"error": "A sync is already running", **await sync_status()}), 409
+        return jsonify(await sync_status()), 202
+    except redis.RedisError as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=ASYNC_PORT, debug=False)
@@ -0,0 +1,105 @@
+from dataclasses import dataclass, field
+
+
+# Typed chat session state. Every class has __slots__ (no per-instance __dict__) and a
+# positional wire form (lists, no field names) for the session store:
+#
+#   ChatSession    -> [use_case, sales_order, invoice, other, last_request_id, last_response, step]
+#   SalesOrderDraft -> [customer_name, customer_code, document_date, [line, ...], current_item]
+#   OrderLine      -> [item_code, item_name, price_unit, quantity]
+#   InvoiceDraft   -> [invoice_number, document_date]
+#
+# Fields are only ever appended, so older wire lists still load (missing tail -> defaults).
+@dataclass(slots=True)
+class OrderLine:
+    item_code: str
+    item_name: str
+    price_unit: object = None  # as SAP/Redis returned it (Decimal or str); only displayed
+    quantity: str | None = None
+
+    def to_wire(self):
+        return [self.item_code, self.item_name, self.price_unit, self.quantity]
+
+    @classmethod
+    def from_wire(cls, wire):
+        return cls(*wire)
+
+    def to_dict(self):
+        """The old dict shape (ItemCode/ItemName/PriceUnit/Quantity), e.g. for JSON replies"""
+        return {"ItemCode": self.item_code, "ItemName": self.item_name,
+                "PriceUnit": self.price_unit, "Quantity": self.quantity}
+
+
+@dataclass(slots=True)
+class SalesOrderDraft:
+    customer_name: str | None = None
+    customer_code: str | None = None
+    document_date: str | None = None
+    items: list = field(default_factory=list)  # OrderLine, in entry order
+    current_item: OrderLine | None = None      # looked up, waiting for its quantity
+
+    def to_wire(self):
+        return [
+            self.customer_name, self.customer_code, self.document_date,
+            [line.to_wire() for line in self.items],
+            self.current_item.to_wire() if self.current_item else None,
+        ]
+
+    @classmethod
+    def from_wire(cls, wire):
+        name, code, date, items, current = (list(wire) + [None] * 5)[:5]
+        return cls(name, code, date,
+                   [OrderLine.from_wire(line) for line in items or ()],
+                   OrderLine.from_wire(current) if current else None)
+
+    def to_dict(self):
+        draft = {"customer_name": self.customer_name, "customer_code": self.customer_code,
+                 "document_date": self.document_date, "items": [line.to_dict() for line in self.items]}
+        if self.current_item:
+            draft["current_item"] = self.current_item.to_dict()
+        return draft
+
+
+@dataclass(slots=True)
+class InvoiceDraft:
+    invoice_number: str | None = None
+    document_date: str | None = None
+
+    def to_wire(self):
+        return [self.invoice_number, self.document_date]
+
+    @classmethod
+    def from_wire(cls, wire):
+        return cls(*wire)
+
+
+@dataclass(slots=True)
+class ChatSession:
+    use_case: str | None = None  # "sales_order" / "invoice" / "other"
+    sales_order: SalesOrderDraft = field(default_factory=SalesOrderDraft)
+    invoice: InvoiceDraft = field(default_factory=InvoiceDraft)
+    other: dict = field(default_factory=dict)
+    # Idempotency: the client's key for the last applied request and the [status, body] it got,
+    # saved together with the state change so a retried request is answered without redoing it
+    last_request_id: str | None = None
+    last_response: list | None = None
+    step: str | None = None  # the action the flow waits for next (flow_engine checks incoming actions)
+
+    def to_wire(self):
+        return [self.use_case, self.sales_order.to_wire(), self.invoice.to_wire(), self.other,
+                self.last_request_id, self.last_response, self.step]
+
+    @classmethod
+    def from_wire(cls, wire):
+        if isinstance(wire, dict):
+            return cls()  # stored before the typed model; start the conversation over
+        use_case, sales_order, invoice, other, last_request_id, last_response, step = (list(wire) + [None] * 7)[:7]
+        return cls(
+            use_case,
+            SalesOrderDraft.from_wire(sales_order) if sales_order else SalesOrderDraft(),
+            InvoiceDraft.from_wire(invoice) if invoice else InvoiceDraft(),
+            other or {},
+            last_request_id,
+            last_response,
+            step,
+        )
@@ -0,0 +1,281 @@
+from dotenv import load_dotenv
+from master_data import redis_client
+from collections import OrderedDict
+from contextlib import contextmanager
+from uuid import uuid4
+import threading
+import redis
+import json
+import time
+import zlib
+import os
+
+try:
+    import resource  # process RSS in memory-store stats; not available on Windows
+except ImportError:
+    resource = None
+
+load_dotenv()
+
+# --- CONFIG ---
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # "memory" (one process) or "redis" (shared)
+SESSION_TTL = int(os.getenv("SESSION_TTL", "86400"))       # seconds a Redis session survives without activity
+SESSION_COMPRESS_MIN = 1024  # serialized sessions at least this big are zlib-compressed
+
+# Memory backend bounds: idle sessions expire, the least recently used go first when full
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))       # seconds without a request
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))                  # live sessions per process
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))  # background expiry pass, 0 = off
+
+# One request per session at a time: wait this long for the session's lock before giving up
+SESSION_LOCK_TIMEOUT = float(os.getenv("SESSION_LOCK_TIMEOUT", "10"))
+SESSION_LOCK_TTL = 30  # Redis lock expiry (seconds), in case the holding process dies
+
+
+class SessionLocked(Exception):
+    """Raised when another request holds the session's lock for longer than the timeout."""
+
+
+class SessionStore:
+    """Where chat sessions live between /chatbot requests.
+
+    Optimistic concurrency: load() returns the session with its version, save() only
+    succeeds if nobody saved a newer version in between (otherwise it returns False
+    and the caller re-runs the step on the fresh session).
+    """
+
+    def load(self, session_id):
+        """(session dict, version); (None, 0) for an unknown session"""
+        raise NotImplementedError
+
+    def save(self, session_id, session, version):
+        """Store `session` as version + 1 if the stored version is still `version`; False on conflict"""
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def lock(self, session_id, timeout=SESSION_LOCK_TIMEOUT):
+        """Context manager serializing requests of one session; raises SessionLocked on timeout"""
+        raise NotImplementedError
+
+    def start_sweeper(self):
+        """Start background expiry if the backend needs one"""
+
+    def stats(self):
+        return {}
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local, bounded store; sessions vanish on restart.
+
+    Sessions are kept serialized (see dump_session): every load() hands out a fresh copy,
+    and the byte count of what is held is exact. The OrderedDict is kept in access order,
+    so the least recently used session is first, both for LRU eviction and for sweeping.
+    """
+
+    def __init__(self, idle_ttl=SESSION_IDLE_TTL, max_sessions=SESSION_MAX):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> (version, blob, last_access), oldest first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # session_id -> [lock, requests holding or waiting]; dropped when the last one leaves,
+        # so only sessions with a request in progress have an entry
+        self._session_locks = {}
+        self._session_locks_guard = threading.Lock()
+
+        self.evictions = 0
+        self.expirations = 0
+
+    def _drop(self, session_id):
+        _, blob, _ = self._sessions.pop(session_id)
+        self._bytes -= len(blob)
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None, 0
+            version, blob, last_access = entry
+            if time.monotonic() - last_access > self.idle_ttl:
+                self._drop(session_id)
+                self.expirations += 1
+                return None, 0
+        return load_session(blob), version
+
+    def save(self, session_id, session, version):
+        blob = dump_session(session)
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if (entry[0] if entry else 0) != version:
+                return False
+            if entry:
+                self._drop(session_id)
+            self._sessions[session_id] = (version + 1, blob, time.monotonic())
+            self._bytes += len(blob)
+            while len(self._sessions) > self.max_sessions:
+                self._drop(next(iter(self._sessions)))
+                self.evictions += 1
+            return True
+
+    def delete(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop(session_id)
+
+    @contextmanager
+    def lock(self, session_id, timeout=SESSION_LOCK_TIMEOUT):
+        with self._session_locks_guard:
+            entry = self._session_locks.get(session_id)
+            if entry is None:
+                entry = self._session_locks[session_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            if not entry[0].acquire(timeout=timeout):
+                raise SessionLocked(f"Session {session_id} is busy")
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            with self._session_locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._session_locks[session_id]
+
+    def sweep(self):
+        """Drop idle sessions; they are oldest first, so this stops at the first live one"""
+        cutoff = time.monotonic() - self.idle_ttl
+        expired = 0
+        with self._lock:
+            while self._sessions:
+                session_id, (_, _, last_access) = next(iter(self._sessions.items()))
+                if last_access > cutoff:
+                    break
+                self._drop(session_id)
+                expired += 1
+            self.expirations += expired
+        return expired
+
+    def start_sweeper(self, interval=SESSION_SWEEP_INTERVAL):
+        if interval <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                expired = self.sweep()
+                if expired:
+                    print(f"🗑️ Expired {expired} idle sessions ({len(self)} live)")
+
+        threading.Thread(target=run, name="session-sweeper", daemon=True).start()
+
+    def stats(self):
+        stats = {
+            "backend": "memory",
+            "live": len(self._sessions),
+            "max": self.max_sessions,
+            "idle_ttl": self.idle_ttl,
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+        if resource is not None:
+            # ru_maxrss is in KiB on Linux
+            stats["peak_rss_mib"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        return stats
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+def dump_session(session):
+    """Compact JSON, zlib-compressed when large; first byte says which ("j" or "z")"""
+    raw = json.dumps(session, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+    if len(raw) >= SESSION_COMPRESS_MIN:
+        return b"z" + zlib.compress(raw)
+    return b"j" + raw
+
+
+def load_session(blob):
+    if blob[:1] == b"z":
+        return json.loads(zlib.decompress(blob[1:]))
+    return json.loads(blob[1:])
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions shared by every worker process/node: hash session:<id> = {v: version, d: data}.
+
+    save() is one Lua compare-and-set (check version, write, refresh TTL), so no connection
+    is held WATCH-ing while the flow runs.
+    """
+
+    CAS_SCRIPT = """
+    if (redis.call('HGET', KEYS[1], 'v') or '0') ~= ARGV[1] then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], 'v', ARGV[2], 'd', ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return 1
+    """
+
+    # Delete the lock only if it is still ours (it may have expired and been taken over)
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, client=None, prefix="session:", ttl=SESSION_TTL):
+        # Own client without decode_responses: session blobs are bytes
+        self.r = client or redis_client()
+        self.prefix = prefix
+        self.ttl = ttl
+        self._cas = self.r.register_script(self.CAS_SCRIPT)
+        self._release = self.r.register_script(self.RELEASE_SCRIPT)
+
+    def load(self, session_id):
+        version, blob = self.r.hmget(f"{self.prefix}{session_id}", "v", "d")
+        if blob is None:
+            return None, 0
+        return load_session(blob), int(version)
+
+    def save(self, session_id, session, version):
+        saved = self._cas(
+            keys=[f"{self.prefix}{session_id}"],
+            args=[version, version + 1, dump_session(session), self.ttl]
+        )
+        return saved == 1
+
+    def delete(self, session_id):
+        self.r.unlink(f"{self.prefix}{session_id}")
+
+    @contextmanager
+    def lock(self, session_id, timeout=SESSION_LOCK_TIMEOUT):
+        """SET NX PX lock shared by every process; polled with backoff up to `timeout`"""
+        key, token = f"{self.prefix}{session_id}:lock", uuid4().hex
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        while not self.r.set(key, token, nx=True, px=int(SESSION_LOCK_TTL * 1000)):
+            if time.monotonic() >= deadline:
+                raise SessionLocked(f"Session {session_id} is busy")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        try:
+            yield
+        finally:
+            self._release(keys=[key], args=[token])
+
+    def stats(self):
+        # Redis expires keys itself; counting them would need a SCAN
+        return {"backend": "redis", "ttl": self.ttl}
+
+
+def make_session_store(backend=SESSION_BACKEND):
+    if backend == "redis":
+        return RedisSessionStore()
+    if backend == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")